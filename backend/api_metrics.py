@@ -0,0 +1,228 @@
+"""
+API Metrics
+Per-route request metrics for the http.server based APIs, exposed in Prometheus text format
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# Time spent inside the current request, split by phase ('sqlite', 'serialize', 'compress')
+_request_local = threading.local()
+
+
+def record_phase(phase: str, seconds: float):
+    """Attribute time to a phase of the request running on this thread (no-op outside a request)"""
+    phases = getattr(_request_local, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def phase_timer(phase: str):
+    """Context manager form of record_phase()"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.label_names, labels)} {value:g}"
+                    for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        # labels -> ([count per bucket, +Inf last], sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class RequestMetrics:
+    """
+    Request counts, latency, response size, per-phase time and in-flight gauges for one server.
+    routes maps path regexes to route labels (which may use backreferences); anything unmatched
+    is reported as 'other', so label cardinality stays bounded.
+    """
+
+    def __init__(self, routes: Iterable[Tuple[str, str]], namespace: str = 'navi'):
+        self._routes = [(re.compile(pattern), label) for pattern, label in routes]
+        self.requests = Counter(f'{namespace}_http_requests_total', 'HTTP requests by route, method and status',
+                                ('route', 'method', 'status'))
+        self.latency = Histogram(f'{namespace}_http_request_duration_seconds', 'Time to handle a request',
+                                 ('route', 'method'))
+        self.response_size = Histogram(f'{namespace}_http_response_size_bytes', 'Bytes written per response',
+                                       ('route', 'method'), SIZE_BUCKETS)
+        self.phases = Histogram(f'{namespace}_http_request_phase_seconds',
+                                'Time per request spent in SQLite, JSON serialization and compression',
+                                ('route', 'method', 'phase'))
+        self.in_flight = Gauge(f'{namespace}_http_requests_in_flight', 'Requests currently being handled',
+                               ('route',))
+
+    def route_label(self, path: str) -> str:
+        path = path.split('?', 1)[0]
+        for pattern, label in self._routes:
+            match = pattern.fullmatch(path)
+            if match:
+                return match.expand(label)
+        return 'other'
+
+    def begin(self, method: str, path: str) -> Tuple[str, str, float]:
+        route = self.route_label(path)
+        self.in_flight.inc(route)
+        _request_local.phases = {}
+        return route, method, time.perf_counter()
+
+    def finish(self, request: Tuple[str, str, float], status: Optional[int], size: int):
+        route, method, started = request
+        elapsed = time.perf_counter() - started
+        phases = getattr(_request_local, 'phases', None) or {}
+        _request_local.phases = None
+        self.in_flight.dec(route)
+        self.requests.inc(route, method, str(status or 0))
+        self.latency.observe(elapsed, route, method)
+        self.response_size.observe(size, route, method)
+        for phase, seconds in phases.items():
+            self.phases.observe(seconds, route, method, phase)
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in (self.requests, self.latency, self.response_size, self.phases, self.in_flight):
+            lines.extend(metric.render())
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _CountingWriter:
+    """Wraps a handler's wfile to count the bytes of each response"""
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self._wfile.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._wfile, name)
+
+
+class InstrumentedHandlerMixin:
+    """
+    Mix into a BaseHTTPRequestHandler subclass (before it in the bases) and set request_metrics;
+    every request is then counted and timed. Serve request_metrics.render() from /metrics.
+    """
+
+    request_metrics: RequestMetrics = None
+
+    def setup(self):
+        super().setup()
+        self.wfile = _CountingWriter(self.wfile)
+
+    def parse_request(self):
+        parsed = super().parse_request()
+        if parsed:
+            self._metrics_request = self.request_metrics.begin(self.command, self.path)
+            self._metrics_status = None
+            self.wfile.count = 0
+        return parsed
+
+    def send_response(self, code, message=None):
+        self._metrics_status = code
+        super().send_response(code, message)
+
+    def handle_one_request(self):
+        self._metrics_request = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._metrics_request is not None:
+                self.request_metrics.finish(self._metrics_request, self._metrics_status, self.wfile.count)
+                self._metrics_request = None
+
+    def send_metrics(self):
+        body = self.request_metrics.render()
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
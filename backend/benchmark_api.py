@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Navi API Benchmarks
+Runs the simple_main API server against a throwaway database and reports
+latency/throughput numbers for the hot paths.
+
+Usage:
+    python benchmark_api.py load [--clients 50] [--requests 20] [--workers 64] [--baseline]
+    python benchmark_api.py ann [--documents 50000] [--dim 384] [--k 10] [--nprobe 1,4,8,16,32]
+    python benchmark_api.py upsert [--documents 50000] [--dim 128]
+    python benchmark_api.py comments [--comments 100] [--latency-ms 300] [--workers 1,4,8,16]
+                                     [--rate-limit 50 --rate-window 10]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import simple_main
+import vector_search
+from rate_limiter import TokenBucket
+from regulations_gov_api import FILTER_TIMEZONE, RegulationsGovAPI
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_documents(count: int, dimensions: int = 384, seed: int = 7) -> List[Dict]:
+    """Generate synthetic regulations.gov-shaped documents with embeddings"""
+    rng = random.Random(seed)
+    agencies = ['EPA', 'FCC', 'FDA', 'CMS', 'DOT']
+    documents = []
+    for i in range(count):
+        agency = agencies[i % len(agencies)]
+        documents.append({
+            'documentId': f"{agency}-2025-{i:06d}-0001",
+            'title': f"{agency} proposed rule {i}",
+            'text': ' '.join(rng.choice(['emissions', 'broadband', 'safety', 'rural', 'cost', 'compliance'])
+                             for _ in range(200)),
+            'agencyId': agency,
+            'documentType': 'Proposed Rule',
+            'postedDate': f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            'commentEndDate': f"2025-{1 + (i + 2) % 12:02d}-{1 + i % 28:02d}",
+            'docketId': f"{agency}-2025-{i:06d}",
+            'embedding': [rng.uniform(-1, 1) for _ in range(dimensions)],
+        })
+    return documents
+
+
+class BenchmarkServer:
+    """Context manager that serves APIHandler on an ephemeral port against a temp database"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        # Per-request access logging would dominate the measurements
+        simple_main.APIHandler.log_message = lambda handler, format, *args: None
+        simple_main.DB_FILE = os.path.join(self.tmpdir.name, 'navi-bench.db')
+        simple_main.init_db()
+        if simple_main.ann_index is not None:
+            simple_main.ann_index.index_dir = os.path.join(self.tmpdir.name, 'ann_index')
+            simple_main.ann_index.open()
+        self.server = simple_main.ThreadPoolHTTPServer(('localhost', 0), simple_main.APIHandler,
+                                                       workers=self.workers)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def request(self, method: str, path: str, body=None):
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=60)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        return response.status, data
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+
+def run_load_benchmark(clients: int, requests_per_client: int, workers: int, documents: int) -> Dict:
+    """Fire a mixed read workload from concurrent keep-alive clients"""
+    routes = [
+        f"/documents?limit={documents}",  # the multi-megabyte dump
+        '/documents?limit=10',
+        '/documents/search?q=emissions&limit=10',
+        '/personas',
+        '/health',
+    ]
+
+    with BenchmarkServer(workers) as server:
+        server.request('POST', '/documents/bulk', {'documents': make_documents(documents)})
+        latencies: Dict[str, List[float]] = {route: [] for route in routes}
+        errors = []
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(clients)
+
+        def client(client_index: int):
+            conn = http.client.HTTPConnection('localhost', server.port, timeout=120)
+            start_barrier.wait()
+            for i in range(requests_per_client):
+                route = routes[(client_index + i) % len(routes)]
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', route)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        raise RuntimeError(f"HTTP {response.status}")
+                except Exception as e:
+                    with lock:
+                        errors.append(f"{route}: {e}")
+                    conn.close()
+                    conn = http.client.HTTPConnection('localhost', server.port, timeout=120)
+                    continue
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies[route].append(elapsed)
+            conn.close()
+
+        wall_started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'workers': workers,
+        'clients': clients,
+        'requests': len(all_latencies),
+        'errors': errors,
+        'throughput_rps': len(all_latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(all_latencies, 50),
+        'p99_ms': percentile(all_latencies, 99),
+        'mean_ms': statistics.mean(all_latencies) if all_latencies else 0.0,
+        'routes': {
+            route: {'p50_ms': percentile(values, 50), 'p99_ms': percentile(values, 99)}
+            for route, values in latencies.items()
+        },
+    }
+
+
+def print_load_report(result: Dict):
+    print(f"workers={result['workers']} clients={result['clients']} requests={result['requests']} "
+          f"errors={len(result['errors'])}")
+    print(f"  throughput: {result['throughput_rps']:.1f} req/s")
+    print(f"  overall:    p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms mean={result['mean_ms']:.1f}ms")
+    for route, stats in result['routes'].items():
+        print(f"  {route:<45} p50={stats['p50_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms")
+
+
+def run_ann_benchmark(documents: int, dim: int, k: int, nprobes: List[int], queries: int = 200) -> List[Dict]:
+    """Recall@k and latency of the IVF index against exact brute-force search"""
+    np = vector_search.np
+    rng = np.random.default_rng(11)
+    # Embeddings cluster by topic, so sample around a few hundred random centres
+    centres = rng.normal(size=(max(8, documents // 200), dim)).astype(np.float32)
+    data = centres[rng.integers(0, len(centres), documents)] + 1.5 * rng.normal(size=(documents, dim)).astype(np.float32)
+    query_vectors = centres[rng.integers(0, len(centres), queries)] + 1.5 * rng.normal(size=(queries, dim)).astype(np.float32)
+    ids = [f"DOC-{i}" for i in range(documents)]
+
+    started = time.perf_counter()
+    index = vector_search.IVFIndex(dim)
+    index.upsert(ids, data)
+    build_seconds = time.perf_counter() - started
+
+    normalized = vector_search.normalize_rows(data.astype(np.float32))
+    exact_results = []
+    exact_started = time.perf_counter()
+    for query in query_vectors:
+        scores = normalized @ (query / np.linalg.norm(query))
+        exact_results.append({ids[i] for i in vector_search.top_k(scores, k)})
+    exact_ms = (time.perf_counter() - exact_started) * 1000 / queries
+
+    results = []
+    for nprobe in nprobes:
+        hits = 0
+        latencies = []
+        for query, expected in zip(query_vectors, exact_results):
+            query_started = time.perf_counter()
+            found = index.search(query, k, nprobe)
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            hits += len(expected & {document_id for document_id, _ in found})
+        results.append({
+            'nprobe': nprobe,
+            'nlist': index.nlist,
+            'recall': hits / (k * queries),
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            'exact_ms': exact_ms,
+            'build_seconds': build_seconds,
+        })
+    return results
+
+
+def print_ann_report(results: List[Dict], documents: int, dim: int, k: int):
+    first = results[0]
+    print(f"documents={documents} dim={dim} nlist={first['nlist']} build={first['build_seconds']:.2f}s "
+          f"exact={first['exact_ms']:.2f}ms/query")
+    for result in results:
+        print(f"  nprobe={result['nprobe']:<4} recall@{k}={result['recall']:.3f} "
+              f"p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms")
+
+
+def legacy_upsert_documents(conn, documents: List[Dict]):
+    """The per-row SELECT then UPDATE/INSERT loop that /documents/bulk used before upsert_documents()"""
+    cursor = conn.cursor()
+    for doc in documents:
+        row, _ = simple_main.normalize_document(doc)
+        cursor.execute("SELECT id FROM documents WHERE document_id = ?", (row[0],))
+        if cursor.fetchone():
+            cursor.execute("""
+                UPDATE documents
+                SET title = ?, text = ?, agency_id = ?, document_type = ?,
+                    web_comment_link = ?, web_document_link = ?, web_docket_link = ?,
+                    docket_id = ?, embedding = ?, posted_date = ?, comment_end_date = ?
+                WHERE document_id = ?
+            """, row[1:] + row[:1])
+        else:
+            cursor.execute(f"""
+                INSERT INTO documents ({', '.join(simple_main.UPSERT_DOCUMENT_COLUMNS)})
+                VALUES ({', '.join('?' * len(row))})
+            """, row)
+    conn.commit()
+
+
+def run_upsert_benchmark(documents: int, dim: int) -> List[Dict]:
+    """
+    Rows/sec of the legacy and set-based upsert paths for three loads: a fresh insert, a re-upload
+    where every document's title changed, and an identical re-upload (which the set-based path
+    skips row by row, so it measures change detection rather than writes)
+    """
+    payload = make_documents(documents, dim)
+    changed = [dict(doc, title=f"{doc['title']} v2") for doc in payload]
+    phases = (('insert', payload), ('update', changed), ('unchanged', changed))
+    strategies: Dict[str, Callable] = {
+        'legacy (SELECT + UPDATE/INSERT per row)': legacy_upsert_documents,
+        'set-based (executemany ON CONFLICT)': simple_main.upsert_documents,
+    }
+    results = []
+    for name, upsert in strategies.items():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            simple_main.DB_FILE = os.path.join(tmpdir, 'navi-bench.db')
+            simple_main.init_db()
+            conn = sqlite3.connect(simple_main.DB_FILE)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            for phase, phase_payload in phases:
+                started = time.perf_counter()
+                upsert(conn, phase_payload)
+                elapsed = time.perf_counter() - started
+                results.append({'strategy': name, 'phase': phase, 'seconds': elapsed,
+                                'rows_per_second': documents / elapsed if elapsed else 0.0})
+            conn.close()
+    return results
+
+
+def print_upsert_report(results: List[Dict], documents: int, dim: int):
+    print(f"documents={documents} dim={dim}")
+    for result in results:
+        print(f"  {result['strategy']:<42} {result['phase']:<9} {result['rows_per_second']:>10.0f} rows/s "
+              f"({result['seconds']:.2f}s)")
+
+
+class StubRegulationsServer:
+    """
+    Context manager serving a minimal regulations.gov v4 API on an ephemeral port: one document
+    with `comments` comments, each request delayed by latency seconds. The comment list enforces
+    the real limits (250 per page, 20 pages per query) and supports the lastModifiedDate filter;
+    three comments share each lastModifiedDate second. With rate_limit set, at most that many
+    requests are served per rolling rate_window seconds and the rest get 429 with Retry-After;
+    every response carries X-RateLimit-Limit and X-RateLimit-Remaining.
+    """
+
+    document_id = 'BENCH-2024-0001-0001'
+    object_id = '0900000000000001'
+
+    def __init__(self, comments: int, latency: float, rate_limit: Optional[int] = None, rate_window: float = 3600.0):
+        self.comments = comments
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.requests = 0
+        self.rejected = 0
+        self._served = deque()
+        self._lock = threading.Lock()
+        self.server = None
+
+    def admit(self) -> Tuple[bool, Dict[str, str]]:
+        """Count a request against the rolling quota: (allowed, rate limit headers)"""
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit is None:
+                return True, {}
+            now = time.monotonic()
+            while self._served and self._served[0] <= now - self.rate_window:
+                self._served.popleft()
+            allowed = len(self._served) < self.rate_limit
+            if allowed:
+                self._served.append(now)
+            else:
+                self.rejected += 1
+            headers = {'X-RateLimit-Limit': str(self.rate_limit),
+                       'X-RateLimit-Remaining': str(self.rate_limit - len(self._served))}
+            if not allowed:
+                headers['Retry-After'] = f"{self._served[0] + self.rate_window - now:.2f}"
+            return allowed, headers
+
+    @staticmethod
+    def modified_date(number: int) -> str:
+        return (datetime(2024, 1, 1, 12, tzinfo=timezone.utc) + timedelta(seconds=number // 3)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def list_comments(self, query: Dict[str, List[str]]):
+        """Comment list response for the query, or None when it breaks the API's paging limits"""
+        size = int(query.get('page[size]', ['25'])[0])
+        page = int(query.get('page[number]', ['1'])[0])
+        if size > 250 or page > 20:
+            return None
+        numbers = range(self.comments)
+        since = query.get('filter[lastModifiedDate][ge]')
+        if since:
+            moment = datetime.strptime(since[0], '%Y-%m-%d %H:%M:%S').replace(tzinfo=FILTER_TIMEZONE)
+            since_utc = moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            numbers = [number for number in numbers if self.modified_date(number) >= since_utc]
+        if query.get('sort', [''])[0].startswith('-'):
+            numbers = list(reversed(numbers))
+        selected = list(numbers)[(page - 1) * size:page * size]
+        return {
+            'data': [{'id': f"{self.document_id}-C{number:05d}", 'type': 'comments',
+                      'attributes': {'lastModifiedDate': self.modified_date(number)}} for number in selected],
+            'meta': {'totalElements': len(numbers), 'pageNumber': page, 'pageSize': size,
+                     'hasNextPage': page * size < len(numbers) and page < 20},
+        }
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                allowed, rate_headers = stub.admit()
+                time.sleep(stub.latency)
+                if not allowed:
+                    self.send_response(429)
+                    for name, value in rate_headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                parsed = urlparse(self.path)
+                parts = parsed.path.strip('/').split('/')
+                if parts[-2:] == ['documents', stub.document_id]:
+                    body = {'data': {'id': stub.document_id, 'attributes': {'objectId': stub.object_id}}}
+                elif parts[-1] == 'comments':
+                    body = stub.list_comments(parse_qs(parsed.query))
+                    if body is None:
+                        self.send_error(400)
+                        return
+                elif len(parts) >= 2 and parts[-2] == 'comments':
+                    number = int(parts[-1].rsplit('C', 1)[-1])
+                    body = {'data': {'id': parts[-1], 'attributes': {
+                        'commentOnDocumentId': stub.document_id,
+                        'comment': f"Stub comment {parts[-1]} about cost and compliance.",
+                        'postedDate': stub.modified_date(number),
+                        'lastModifiedDate': stub.modified_date(number),
+                    }}}
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                for name, value in rate_headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(('localhost', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self) -> str:
+        return f"http://localhost:{self.server.server_address[1]}/v4"
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def run_comment_fetch_benchmark(comments: int, latency_ms: float, workers: List[int],
+                                rate_limit: Optional[int] = None, rate_window: float = 3600.0) -> List[Dict]:
+    """
+    Wall time of fetch_comments_by_document_id (list + one detail request per comment) per worker
+    count. With rate_limit, the stub enforces that quota and the client paces itself with a token
+    bucket of the same quota; 429s answered by the stub are reported as rejected.
+    """
+    results = []
+    with StubRegulationsServer(comments, latency_ms / 1000, rate_limit, rate_window) as stub:
+        for worker_count in workers:
+            limiter = TokenBucket(rate_limit, rate_window) if rate_limit else False
+            api = RegulationsGovAPI(api_key='benchmark', cache=False, rate_limiter=limiter, comment_store=False)
+            api.base_url = stub.base_url
+            stub.requests = stub.rejected = 0
+            started = time.perf_counter()
+            report = api.fetch_comments_report(stub.document_id, comments, max_workers=worker_count)
+            elapsed = time.perf_counter() - started
+            results.append({'workers': worker_count, 'seconds': elapsed, 'comments': len(report.comments),
+                            'failures': len(report.failures), 'requests': stub.requests, 'rejected': stub.rejected})
+            if rate_limit:
+                # Let the stub's window drain so the next run starts with a full quota
+                time.sleep(rate_window)
+    return results
+
+
+def print_comment_fetch_report(results: List[Dict], comments: int, latency_ms: float):
+    print(f"comments={comments} latency={latency_ms:g}ms per request")
+    serial = results[0]['seconds'] if results else 0.0
+    for result in results:
+        speedup = serial / result['seconds'] if result['seconds'] else 0.0
+        print(f"  workers={result['workers']:<3} {result['seconds']:>7.2f}s  {speedup:>5.1f}x  "
+              f"comments={result['comments']} failures={result['failures']} requests={result['requests']} "
+              f"rejected={result['rejected']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Navi API benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load = subparsers.add_parser('load', help='p50/p99 latency under concurrent clients')
+    load.add_argument('--clients', type=int, default=50)
+    load.add_argument('--requests', type=int, default=20, help='requests per client')
+    load.add_argument('--workers', type=int, default=64)
+    load.add_argument('--documents', type=int, default=500)
+    load.add_argument('--baseline', action='store_true',
+                      help='also run with a single worker (the old serial HTTPServer behaviour)')
+
+    ann = subparsers.add_parser('ann', help='IVF index recall@k against exact search')
+    ann.add_argument('--documents', type=int, default=50000)
+    ann.add_argument('--dim', type=int, default=384)
+    ann.add_argument('--k', type=int, default=10)
+    ann.add_argument('--nprobe', default='1,4,8,16,32', help='comma-separated nprobe values')
+
+    upsert = subparsers.add_parser('upsert', help='rows/sec of /documents/bulk storage, before and after')
+    upsert.add_argument('--documents', type=int, default=50000)
+    upsert.add_argument('--dim', type=int, default=128)
+
+    comments = subparsers.add_parser('comments', help='regulations.gov comment fetch time against a local stub')
+    comments.add_argument('--comments', type=int, default=100)
+    comments.add_argument('--latency-ms', type=float, default=300)
+    comments.add_argument('--workers', default='1,4,8,16', help='comma-separated worker counts')
+    comments.add_argument('--rate-limit', type=int, help='requests the stub allows per --rate-window seconds')
+    comments.add_argument('--rate-window', type=float, default=10.0)
+
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        if args.baseline:
+            print_load_report(run_load_benchmark(args.clients, args.requests, 1, args.documents))
+        print_load_report(run_load_benchmark(args.clients, args.requests, args.workers, args.documents))
+    elif args.command == 'ann':
+        nprobes = [int(value) for value in args.nprobe.split(',')]
+        print_ann_report(run_ann_benchmark(args.documents, args.dim, args.k, nprobes), args.documents, args.dim, args.k)
+    elif args.command == 'upsert':
+        print_upsert_report(run_upsert_benchmark(args.documents, args.dim), args.documents, args.dim)
+    elif args.command == 'comments':
+        workers = [int(value) for value in args.workers.split(',')]
+        print_comment_fetch_report(run_comment_fetch_benchmark(args.comments, args.latency_ms, workers,
+                                                               args.rate_limit, args.rate_window),
+                                   args.comments, args.latency_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,15 +9,26 @@ from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import threading
 from typing import Dict, Any
+from api_metrics import InstrumentedHandlerMixin, RequestMetrics, phase_timer
+from http_compression import COMPRESSION_MIN_SIZE, choose_encoding, compress_body, dumps_compact
 from ollama_comment_analyzer import analyze_document_comments, get_comment_count, test_connections
+from regulations_cache import get_default_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class CommentAnalysisHandler(BaseHTTPRequestHandler):
+# Route labels for /metrics
+COMMENT_ANALYSIS_ROUTES = [
+    (r'/api/comment-analysis/(health|test|count|analyze|cache)', r'/api/comment-analysis/\1'),
+    (r'/metrics', '/metrics'),
+]
+
+class CommentAnalysisHandler(InstrumentedHandlerMixin, BaseHTTPRequestHandler):
     """HTTP request handler for comment analysis API"""
     
+    request_metrics = RequestMetrics(COMMENT_ANALYSIS_ROUTES, namespace='navi_comment_analysis')
+    
     def do_GET(self):
         """Handle GET requests"""
         try:
@@ -31,6 +42,10 @@ class CommentAnalysisHandler(BaseHTTPRequestHandler):
                 self._handle_test_connections()
             elif path == '/api/comment-analysis/count':
                 self._handle_get_comment_count(query_params)
+            elif path == '/api/comment-analysis/cache':
+                self._handle_cache_stats()
+            elif path == '/metrics':
+                self.send_metrics()
             else:
                 self._send_error_response(404, "Endpoint not found")
                 
@@ -62,6 +77,10 @@ class CommentAnalysisHandler(BaseHTTPRequestHandler):
         }
         self._send_json_response(200, response)
     
+    def _handle_cache_stats(self):
+        """Handle regulations.gov response cache stats endpoint"""
+        self._send_json_response(200, get_default_cache().stats())
+    
     def _handle_test_connections(self):
         """Handle test connections endpoint"""
         try:
@@ -127,16 +146,27 @@ class CommentAnalysisHandler(BaseHTTPRequestHandler):
             self._send_error_response(500, f"Analysis failed: {e}")
     
     def _send_json_response(self, status_code: int, data: Dict[str, Any]):
-        """Send JSON response"""
+        """Send JSON response, compressed when the client accepts it and the body is large enough"""
+        with phase_timer('serialize'):
+            body = dumps_compact(data)
+        encoding = None
+        if len(body) >= COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+            with phase_timer('compress'):
+                body = compress_body(body, encoding)
+        
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')  # Enable CORS
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
         
-        response_json = json.dumps(data, indent=2)
-        self.wfile.write(response_json.encode('utf-8'))
+        self.wfile.write(body)
     
     def _send_error_response(self, status_code: int, message: str):
         """Send error response"""
@@ -173,6 +203,7 @@ def start_comment_analysis_server(port: int = 8080, host: str = 'localhost'):
     logger.info("  GET  /api/comment-analysis/test - Test connections")
     logger.info("  GET  /api/comment-analysis/count?document_id=XXX - Get comment count")
     logger.info("  POST /api/comment-analysis/analyze - Analyze comments")
+    logger.info("  GET  /metrics - Prometheus metrics")
     
     try:
         httpd.serve_forever()
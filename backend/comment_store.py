@@ -0,0 +1,150 @@
+"""
+Comment Store
+Local copy of regulations.gov public comments in the Navi database, with a per-document
+high-water mark on lastModifiedDate so later syncs only fetch new or changed comments
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+# Same database as simple_main.DB_FILE. The drafts table is already called `comments`,
+# hence regulation_comments.
+COMMENT_STORE_DB_FILE = os.getenv('NAVI_COMMENT_STORE_DB', 'navi.db')
+
+COMMENT_COLUMNS = ('comment_id', 'document_id', 'docket_id', 'agency_id', 'title', 'comment_text',
+                   'submitter_name', 'organization_name', 'first_name', 'last_name',
+                   'posted_date', 'last_modified_date')
+
+
+def create_tables(cursor):
+    """Create the comment store tables (also called from simple_main.init_db)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS regulation_comments (
+            comment_id TEXT PRIMARY KEY,
+            document_id TEXT NOT NULL,
+            docket_id TEXT,
+            agency_id TEXT,
+            title TEXT,
+            comment_text TEXT,
+            submitter_name TEXT,
+            organization_name TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            posted_date TEXT,
+            last_modified_date TEXT,
+            synced_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_regulation_comments_document_posted
+        ON regulation_comments(document_id, posted_date DESC)
+    """)
+    # Every comment modified before high_water_mark is stored (NULL: nothing stored yet).
+    # last_synced_at is set when a sync runs to the end of the comment list.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS comment_sync_state (
+            document_id TEXT PRIMARY KEY,
+            high_water_mark TEXT,
+            last_synced_at TEXT
+        )
+    """)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class CommentStore:
+    """Thread-safe access to the regulation_comments and comment_sync_state tables"""
+
+    def __init__(self, db_file: str = COMMENT_STORE_DB_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        conn = self._connection()
+        create_tables(conn.cursor())
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, comments: Iterable) -> int:
+        """Insert or replace RegulationsComment objects; returns the number written"""
+        synced_at = _now()
+        rows = [(c.id, c.comment_on_document_id, c.docket_id, c.agency_id, c.title, c.comment_text,
+                 c.submitter_name, c.organization_name, c.first_name, c.last_name,
+                 c.posted_date, c.last_modified_date, synced_at) for c in comments]
+        if not rows:
+            return 0
+        conn = self._connection()
+        conn.executemany(f"""
+            INSERT INTO regulation_comments ({', '.join(COMMENT_COLUMNS)}, synced_at)
+            VALUES ({', '.join('?' * (len(COMMENT_COLUMNS) + 1))})
+            ON CONFLICT(comment_id) DO UPDATE SET
+                {', '.join(f'{column} = excluded.{column}' for column in COMMENT_COLUMNS[1:])},
+                synced_at = excluded.synced_at
+        """, rows)
+        conn.commit()
+        return len(rows)
+
+    def sync_state(self, document_id: str) -> Optional[dict]:
+        row = self._connection().execute("""
+            SELECT high_water_mark, last_synced_at FROM comment_sync_state WHERE document_id = ?
+        """, (document_id,)).fetchone()
+        if row is None:
+            return None
+        return {'high_water_mark': row[0], 'last_synced_at': row[1]}
+
+    def advance_high_water_mark(self, document_id: str, high_water_mark: str):
+        """Record that every comment modified before high_water_mark is stored; it only moves forward"""
+        conn = self._connection()
+        conn.execute("""
+            INSERT INTO comment_sync_state (document_id, high_water_mark) VALUES (?, ?)
+            ON CONFLICT(document_id) DO UPDATE SET
+                high_water_mark = MAX(COALESCE(comment_sync_state.high_water_mark, ''), excluded.high_water_mark)
+        """, (document_id, high_water_mark))
+        conn.commit()
+
+    def record_sync(self, document_id: str):
+        """Mark the document as synced to the end of its comment list just now"""
+        conn = self._connection()
+        conn.execute("""
+            INSERT INTO comment_sync_state (document_id, last_synced_at) VALUES (?, ?)
+            ON CONFLICT(document_id) DO UPDATE SET last_synced_at = excluded.last_synced_at
+        """, (document_id, _now()))
+        conn.commit()
+
+    def comments(self, document_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Stored comments for a document as column -> value dicts, most recently posted first"""
+        rows = self._connection().execute(f"""
+            SELECT {', '.join(COMMENT_COLUMNS)} FROM regulation_comments
+            WHERE document_id = ?
+            ORDER BY posted_date DESC, comment_id DESC
+            LIMIT ?
+        """, (document_id, -1 if limit is None else limit)).fetchall()
+        return [dict(zip(COMMENT_COLUMNS, row)) for row in rows]
+
+    def count(self, document_id: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM regulation_comments WHERE document_id = ?", (document_id,)).fetchone()[0]
+
+
+_default_store: Optional[CommentStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> CommentStore:
+    """The process-wide store shared by every RegulationsGovAPI instance"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CommentStore()
+        return _default_store
@@ -0,0 +1,156 @@
+"""
+Embedding Codec
+Packs embedding vectors into compact little-endian float32 BLOBs for SQLite storage
+
+Layout (all integers little-endian):
+    magic       4 bytes   b'NVEC'
+    version     uint8     format version (currently 1)
+    kind        uint8     0 = single vector, 1 = matrix of chunk vectors
+    model_len   uint16    length of the UTF-8 model name that follows the header
+    rows        uint32    number of vectors (1 for KIND_VECTOR)
+    dim         uint32    dimensions per vector
+    model       model_len bytes
+    data        rows * dim float32 values, row-major
+"""
+
+import base64
+import json
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+
+MAGIC = b'NVEC'
+FORMAT_VERSION = 1
+KIND_VECTOR = 0
+KIND_MATRIX = 1
+
+_HEADER = struct.Struct('<4sBBHII')
+_NEEDS_BYTESWAP = sys.byteorder != 'little'
+
+
+@dataclass
+class EmbeddingHeader:
+    """Metadata stored in front of a packed embedding"""
+    kind: int
+    rows: int
+    dim: int
+    model: Optional[str]
+    data_offset: int
+
+
+def is_packed(value) -> bool:
+    """True if value is a packed embedding BLOB (as opposed to legacy JSON TEXT)"""
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:4]) == MAGIC
+
+
+def _pack(kind: int, rows: int, dim: int, values: array, model: Optional[str]) -> bytes:
+    model_bytes = (model or '').encode('utf-8')[:0xFFFF]
+    if _NEEDS_BYTESWAP:
+        values.byteswap()
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, kind, len(model_bytes), rows, dim) + model_bytes + values.tobytes()
+
+
+def pack_embedding(vector: Optional[Sequence[float]], model: Optional[str] = None) -> Optional[bytes]:
+    """Pack a single embedding vector; empty or missing vectors are stored as NULL"""
+    if not vector:
+        return None
+    values = array('f', vector)
+    return _pack(KIND_VECTOR, 1, len(values), values, model)
+
+
+def pack_chunk_embeddings(chunks: Optional[Sequence[Sequence[float]]], model: Optional[str] = None) -> Optional[bytes]:
+    """Pack a list of equal-length chunk vectors into one matrix BLOB"""
+    if not chunks:
+        return None
+    dim = len(chunks[0])
+    values = array('f')
+    for chunk in chunks:
+        if len(chunk) != dim:
+            raise ValueError(f"Chunk embeddings must share one dimension (got {len(chunk)} and {dim})")
+        values.extend(chunk)
+    return _pack(KIND_MATRIX, len(chunks), dim, values, model)
+
+
+def floats_from_base64(text: str) -> array:
+    """Decode base64 little-endian float32 data (the binary form accepted by the batch embedding API)"""
+    raw = base64.b64decode(text, validate=True)
+    if len(raw) % 4:
+        raise ValueError(f"Binary embedding length {len(raw)} is not a multiple of 4 bytes")
+    values = array('f')
+    values.frombytes(raw)
+    if _NEEDS_BYTESWAP:
+        values.byteswap()
+    return values
+
+
+def read_header(blob) -> EmbeddingHeader:
+    """Parse the header of a packed embedding"""
+    magic, version, kind, model_len, rows, dim = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a packed embedding")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+    model_start = _HEADER.size
+    model = bytes(blob[model_start:model_start + model_len]).decode('utf-8') or None
+    return EmbeddingHeader(kind=kind, rows=rows, dim=dim, model=model, data_offset=model_start + model_len)
+
+
+def unpack_floats(blob, header: Optional[EmbeddingHeader] = None) -> array:
+    """Return the raw float32 payload of a packed embedding as a flat array"""
+    header = header or read_header(blob)
+    values = array('f')
+    values.frombytes(bytes(blob[header.data_offset:header.data_offset + 4 * header.rows * header.dim]))
+    if _NEEDS_BYTESWAP:
+        values.byteswap()
+    return values
+
+
+def unpack_embedding(value) -> Optional[Union[List[float], List[List[float]]]]:
+    """
+    Decode a stored embedding back into plain lists for the JSON API.
+    Accepts packed BLOBs as well as legacy JSON TEXT rows that have not been migrated yet.
+    """
+    if value is None or value == '' or value == b'':
+        return None
+
+    if is_packed(value):
+        try:
+            header = read_header(value)
+            values = unpack_floats(value, header).tolist()
+        except (ValueError, struct.error):
+            return None
+        if header.kind == KIND_VECTOR:
+            return values
+        return [values[i * header.dim:(i + 1) * header.dim] for i in range(header.rows)]
+
+    try:
+        return _decode_legacy(value)
+    except ValueError:
+        return None
+
+
+def _decode_legacy(value):
+    """Parse a legacy JSON TEXT embedding, raising ValueError if it cannot be decoded"""
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Undecodable legacy embedding: {e}") from e
+
+
+def repack_legacy_value(value, matrix: bool = False, model: Optional[str] = None) -> Optional[bytes]:
+    """
+    Convert a legacy JSON TEXT embedding to a packed BLOB (used by the online migration).
+    Raises ValueError on TEXT that is not valid JSON, so the caller can leave the row as it is.
+    """
+    if is_packed(value):
+        return bytes(value)
+    if value is None or value == '':
+        return None
+    decoded = _decode_legacy(value)
+    if not decoded:
+        return None
+    if matrix:
+        return pack_chunk_embeddings(decoded, model)
+    return pack_embedding(decoded, model)
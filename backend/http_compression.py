@@ -0,0 +1,98 @@
+"""
+HTTP Compression
+Accept-Encoding negotiation and gzip/zstd response compression shared by the API servers
+"""
+
+import json
+import zlib
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+# Bodies smaller than this are sent as-is: the headers and CPU cost outweigh the savings
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Server preference when the client accepts several encodings equally
+_PREFERENCE = ('zstd', 'gzip')
+
+
+def supported_encodings():
+    return _PREFERENCE if zstandard is not None else ('gzip',)
+
+
+def dumps_compact(data) -> bytes:
+    """Serialize a response body without the whitespace json.dumps adds by default"""
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def _parse_accept_encoding(header: Optional[str]):
+    """Map each coding named in an Accept-Encoding header to its q-value"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported content coding for a request, or None for identity"""
+    accepted = _parse_accept_encoding(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_body(body: bytes, encoding: Optional[str]) -> bytes:
+    """Compress a complete response body with the negotiated encoding"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    return body
+
+
+class StreamCompressor:
+    """
+    Incremental compressor for chunked responses. compress() flushes after every call so
+    each chunk can be decoded as soon as it arrives; finish() ends the stream.
+    """
+
+    def __init__(self, encoding: Optional[str]):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == 'gzip':
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            self._compressor = None
+
+    def compress(self, data: bytes) -> bytes:
+        if self._compressor is None:
+            return data
+        if self.encoding == 'zstd':
+            return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._compressor is None:
+            return b''
+        return self._compressor.flush()
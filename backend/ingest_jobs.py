@@ -0,0 +1,254 @@
+"""
+Ingest Jobs
+Background document ingestion with progress reporting. Uploads are spooled to disk as NDJSON
+and tracked in the jobs table, so queued or interrupted jobs resume after a restart.
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set
+
+from request_body import iter_ndjson
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _elapsed_seconds(started_at: Optional[str], finished_at: Optional[str]) -> float:
+    if not started_at:
+        return 0.0
+    end = datetime.fromisoformat(finished_at) if finished_at else datetime.now(timezone.utc)
+    return max(0.0, (end - datetime.fromisoformat(started_at)).total_seconds())
+
+
+class IngestJobQueue:
+    """
+    In-process queue of document ingest jobs.
+
+    process_batch(conn, documents) -> (inserted, updated, errors) stores one batch and commits it;
+    progress is recorded after every batch. A job interrupted between the two repeats that batch
+    on resume, which is safe because document writes are upserts.
+    """
+
+    def __init__(self, spool_dir: str, connection_factory: Callable, process_batch: Callable,
+                 batch_size: int, workers: int = 1, on_finished: Optional[Callable] = None):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self._connection_factory = connection_factory
+        self._process_batch = process_batch
+        self._on_finished = on_finished
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Set[Future] = set()
+        # Re-entrant: a future that is already done runs its callback (which takes the lock) in _schedule
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start the workers and re-queue jobs that were queued or running when the server stopped"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._stopping.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='navi-ingest')
+        conn = self._connection_factory()
+        pending = conn.execute("""
+            SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at
+        """).fetchall()
+        for (job_id,) in pending:
+            logger.info(f"Resuming ingest job {job_id}")
+            with self._lock:
+                self._schedule(job_id)
+
+    def shutdown(self, timeout: float = 30.0) -> bool:
+        """
+        Stop taking work and wait up to timeout seconds for running jobs to commit their current
+        batch; they are resumed on the next start. Returns False if a job was still running, in
+        which case its connection must not be closed yet.
+        """
+        self._stopping.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+            running = set(self._futures)
+        if executor is None:
+            return True
+        executor.shutdown(wait=False, cancel_futures=True)
+        _, still_running = wait(running, timeout=timeout)
+        if still_running:
+            logger.warning(f"{len(still_running)} ingest job(s) still running after {timeout}s")
+        return not still_running
+
+    def _schedule(self, job_id: str):
+        """Submit a job to the workers; call with _lock held"""
+        future = self._executor.submit(self._run, job_id)
+        self._futures.add(future)
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def submit_documents(self, source: str, documents: Iterable[Dict]) -> str:
+        """Queue already-parsed documents; returns the job id"""
+        return self._submit(source, (json.dumps(doc).encode('utf-8') + b'\n' for doc in documents))
+
+    def submit_ndjson(self, source: str, pieces: Iterator[bytes]) -> str:
+        """Queue a raw NDJSON body without parsing it; returns the job id"""
+        return self._submit(source, pieces)
+
+    def _submit(self, source: str, pieces: Iterator[bytes]) -> str:
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.spool_dir, exist_ok=True)
+        spool_path = os.path.join(self.spool_dir, f"{job_id}.ndjson")
+        total = 0
+        ends_with_newline = True
+        try:
+            with open(spool_path, 'wb') as spool:
+                for piece in pieces:
+                    spool.write(piece)
+                    total += piece.count(b'\n')
+                    ends_with_newline = piece.endswith(b'\n')
+        except BaseException:
+            os.remove(spool_path)
+            raise
+        if not ends_with_newline:
+            total += 1
+
+        conn = self._connection_factory()
+        conn.execute("""
+            INSERT INTO jobs (id, source, status, spool_path, total, created_at)
+            VALUES (?, ?, 'queued', ?, ?, ?)
+        """, (job_id, source, spool_path, total, _now()))
+        conn.commit()
+
+        with self._lock:
+            if self._executor is not None:
+                self._schedule(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Job status with throughput and ETA, or None if the id is unknown"""
+        conn = self._connection_factory()
+        row = conn.execute("""
+            SELECT id, source, status, total, processed, inserted, updated, error_count, errors, error,
+                   created_at, started_at, run_started_at, run_start_processed, finished_at
+            FROM jobs WHERE id = ?
+        """, (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        (job_id, source, status, total, processed, inserted, updated, error_count, errors, error,
+         created_at, started_at, run_started_at, run_start_processed, finished_at) = row
+        # Throughput covers the current (or last) run only, so a resumed job is not diluted by downtime
+        elapsed = _elapsed_seconds(run_started_at, finished_at)
+        rate = (processed - run_start_processed) / elapsed if elapsed else 0.0
+        eta = (total - processed) / rate if status == 'running' and rate else None
+        return {
+            'job_id': job_id,
+            'source': source,
+            'status': status,
+            'total': total,
+            'processed': processed,
+            'inserted': inserted,
+            'updated': updated,
+            'error_count': error_count,
+            'errors': json.loads(errors) if errors else [],
+            'error': error,
+            'rows_per_second': round(rate, 1),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at,
+        }
+
+    def _run(self, job_id: str):
+        conn = self._connection_factory()
+        row = conn.execute("""
+            SELECT spool_path, processed, inserted, updated, error_count, errors, started_at
+            FROM jobs WHERE id = ?
+        """, (job_id,)).fetchone()
+        if row is None:
+            return
+        spool_path, processed, inserted, updated, error_count, errors, started_at = row
+        errors = json.loads(errors) if errors else []
+        now = _now()
+        conn.execute("""
+            UPDATE jobs SET status = 'running', started_at = ?, run_started_at = ?, run_start_processed = ?
+            WHERE id = ?
+        """, (started_at or now, now, processed, job_id))
+        conn.commit()
+
+        def record_progress(line_number):
+            conn.execute("""
+                UPDATE jobs SET processed = ?, inserted = ?, updated = ?, error_count = ?, errors = ?
+                WHERE id = ?
+            """, (line_number, inserted, updated, error_count, json.dumps(errors), job_id))
+            conn.commit()
+
+        try:
+            batch = []
+            line_number = processed
+            for line_number, doc in iter_ndjson(self._read_spool(spool_path)):
+                # Lines up to `processed` were committed by an earlier run
+                if line_number <= processed:
+                    continue
+                if isinstance(doc, dict):
+                    batch.append(doc)
+                else:
+                    error_count += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(f"Line {line_number}: expected a JSON object per line ({doc})")
+                if len(batch) >= self.batch_size:
+                    inserted, updated, error_count = self._store(conn, batch, inserted, updated, error_count, errors)
+                    batch = []
+                    record_progress(line_number)
+                    if self._stopping.is_set():
+                        # Progress so far is committed; the job stays 'running' and resumes on restart
+                        return
+            if batch:
+                inserted, updated, error_count = self._store(conn, batch, inserted, updated, error_count, errors)
+            record_progress(line_number)
+        except Exception as e:
+            logger.exception(f"Ingest job {job_id} failed")
+            conn.rollback()
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                         (str(e), _now(), job_id))
+            conn.commit()
+            return
+        finally:
+            if self._on_finished is not None:
+                self._on_finished()
+
+        conn.execute("UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ?", (_now(), job_id))
+        conn.commit()
+        try:
+            os.remove(spool_path)
+        except OSError:
+            pass
+
+    def _store(self, conn, batch, inserted, updated, error_count, errors):
+        batch_inserted, batch_updated, batch_errors = self._process_batch(conn, batch)
+        for message in batch_errors:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(message)
+        return inserted + batch_inserted, updated + batch_updated, error_count + len(batch_errors)
+
+    @staticmethod
+    def _read_spool(path: str) -> Iterator[bytes]:
+        with open(path, 'rb') as spool:
+            while True:
+                piece = spool.read(READ_SIZE)
+                if not piece:
+                    return
+                yield piece
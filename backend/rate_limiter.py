@@ -0,0 +1,100 @@
+"""
+Rate Limiter
+Thread-safe token bucket that follows a server's X-RateLimit-* headers, plus jittered backoff helpers
+"""
+
+import random
+import threading
+import time
+from typing import Mapping, Optional
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Retry-After in seconds, if the server sent one in delta-seconds form"""
+    value = headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket for a quota of `limit` requests per `window` seconds, refilled continuously at
+    limit / window tokens per second, holding at most `limit` tokens.
+
+    Responses feed update_from_headers(): X-RateLimit-Limit replaces the quota and
+    X-RateLimit-Remaining caps the local tokens, so the bucket never believes it has more requests
+    left than the server does (including requests made by other instances sharing the key).
+    """
+
+    def __init__(self, limit: int, window: float = 3600.0):
+        self.limit = max(1, limit)
+        self.window = window
+        self._tokens = float(self.limit)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.window
+
+    def _refill(self, now: float):
+        self._tokens = min(float(self.limit), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, waiting for the refill if needed; False if none would be free within timeout"""
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if now > started:
+                        self.waits += 1
+                        self.wait_seconds += now - started
+                    return True
+                wait = (1 - self._tokens) / self.rate
+                if deadline is not None and now + wait > deadline:
+                    return False
+                self._condition.wait(wait)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        try:
+            limit = int(headers['X-RateLimit-Limit']) if 'X-RateLimit-Limit' in headers else None
+            remaining = int(headers['X-RateLimit-Remaining']) if 'X-RateLimit-Remaining' in headers else None
+        except ValueError:
+            return
+        with self._condition:
+            self._refill(time.monotonic())
+            if limit and limit > 0:
+                self.limit = limit
+            if remaining is not None:
+                self._tokens = min(self._tokens, float(remaining), float(self.limit))
+
+    def pause(self, seconds: float):
+        """After a 429: hand out no tokens for at least `seconds`"""
+        with self._condition:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def stats(self):
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'tokens': round(self._tokens, 2),
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+            }
@@ -0,0 +1,206 @@
+"""
+Regulations.gov Response Cache
+SQLite-backed cache of regulations.gov API responses, keyed by URL without the api_key,
+with per-endpoint TTLs, size-bounded LRU eviction, hit-rate stats and an offline mode
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB_FILE = os.getenv('NAVI_REGULATIONS_CACHE_DB', 'regulations_cache.db')
+CACHE_MAX_BYTES = int(float(os.getenv('NAVI_REGULATIONS_CACHE_MB', '256')) * 1024 * 1024)
+# Serve only from the cache and never touch the network
+OFFLINE_MODE = os.getenv('NAVI_REGULATIONS_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+DAY = 24 * 60 * 60
+
+# Endpoint patterns (matched against the URL path) -> (endpoint name, TTL in seconds).
+# A posted comment and a document's objectId practically never change; lists grow as comments
+# arrive. Anything unmatched (e.g. the connection test) is never cached.
+ENDPOINT_TTLS = [
+    (re.compile(r'/comments/[^/]+$'), 'comment', 30 * DAY),
+    (re.compile(r'/documents/[^/]+$'), 'document', 7 * DAY),
+    (re.compile(r'/comments$'), 'comment_list', 60 * 60),
+]
+
+# When the cache outgrows max_bytes, least recently used entries are dropped down to this fraction
+EVICT_TO_FRACTION = 0.9
+
+
+class OfflineCacheMiss(ValueError):
+    """Offline mode was asked for a response that is not in the cache"""
+
+
+def normalize_url(url: str) -> str:
+    """Cache key for a request URL: path plus sorted query parameters, without the api_key"""
+    parsed = urlparse(url)
+    query = sorted((name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+                   if name != 'api_key')
+    return f"{parsed.netloc}{parsed.path}" + (f"?{urlencode(query)}" if query else '')
+
+
+class RegulationsCache:
+    """
+    Thread-safe response cache in its own SQLite file (one connection per thread, WAL mode).
+
+    get() returns a fresh entry, or in offline mode any entry however old. Entries are stored
+    zlib-compressed; the size bound counts compressed bytes.
+    """
+
+    def __init__(self, db_file: str = CACHE_DB_FILE, max_bytes: int = CACHE_MAX_BYTES,
+                 offline: bool = OFFLINE_MODE, ttls=None):
+        self.db_file = db_file
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.ttls = ttls if ttls is not None else ENDPOINT_TTLS
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS http_cache (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_last_accessed ON http_cache(last_accessed)")
+        conn.commit()
+        self._size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def endpoint_ttl(self, url: str) -> Tuple[Optional[str], int]:
+        """(endpoint name, TTL) for a URL; TTL 0 means the response is not cached"""
+        path = urlparse(url).path
+        for pattern, endpoint, ttl in self.ttls:
+            if pattern.search(path):
+                return endpoint, ttl
+        return None, 0
+
+    def get(self, url: str) -> Optional[Any]:
+        """The cached JSON for url, or None on a miss (expired entries count as misses unless offline)"""
+        endpoint, ttl = self.endpoint_ttl(url)
+        if not ttl and not self.offline:
+            return None
+        key = normalize_url(url)
+        conn = self._connection()
+        row = conn.execute("SELECT body, expires_at FROM http_cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (row[1] <= now and not self.offline):
+            with self._lock:
+                self.misses += 1
+            return None
+        conn.execute("UPDATE http_cache SET last_accessed = ? WHERE key = ?", (now, key))
+        conn.commit()
+        with self._lock:
+            self.hits += 1
+            if row[1] <= now:
+                self.stale_hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url: str, data: Any):
+        """Store a successful JSON response if its endpoint is cacheable"""
+        endpoint, ttl = self.endpoint_ttl(url)
+        if not ttl:
+            return
+        key = normalize_url(url)
+        body = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connection()
+        with self._lock:
+            previous = conn.execute("SELECT size FROM http_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute("""
+                INSERT OR REPLACE INTO http_cache (key, endpoint, body, size, fetched_at, expires_at, last_accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (key, endpoint, body, len(body), now, now + ttl, now))
+            conn.commit()
+            self._size += len(body) - (previous[0] if previous else 0)
+            self.stores += 1
+            if self._size > self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        target = self.max_bytes * EVICT_TO_FRACTION
+        # Expired entries go first, then the least recently used
+        rows = conn.execute("""
+            SELECT key, size FROM http_cache ORDER BY expires_at > ?, last_accessed
+        """, (time.time(),))
+        doomed = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            doomed.append((key,))
+            self._size -= size
+        conn.executemany("DELETE FROM http_cache WHERE key = ?", doomed)
+        conn.commit()
+        self.evictions += len(doomed)
+        logger.info(f"Evicted {len(doomed)} cached regulations.gov responses")
+
+    def clear(self):
+        conn = self._connection()
+        with self._lock:
+            conn.execute("DELETE FROM http_cache")
+            conn.commit()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        by_endpoint = {endpoint: {'entries': entries, 'bytes': size} for endpoint, entries, size in conn.execute(
+            "SELECT endpoint, COUNT(*), SUM(size) FROM http_cache GROUP BY endpoint")}
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': sum(item['entries'] for item in by_endpoint.values()),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'offline': self.offline,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'stale_hits': self.stale_hits,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'endpoints': by_endpoint,
+            }
+
+
+_default_cache: Optional[RegulationsCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> RegulationsCache:
+    """The process-wide cache shared by every RegulationsGovAPI instance"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RegulationsCache()
+        return _default_cache
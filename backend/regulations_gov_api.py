@@ -6,17 +6,84 @@ Handles fetching public comments from regulations.gov API v4 and provides AI ana
 import requests
 import json
 import logging
-from typing import List, Dict, Optional, Any
-from dataclasses import dataclass
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import quote
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Iterator, Optional, Any, Union
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 import re
 import os
+import sqlite3
+import time
 from local_storage_reader import get_regulations_api_key
+from comment_store import CommentStore, get_default_store
+from rate_limiter import TokenBucket, backoff_delay, retry_after_seconds
+from regulations_cache import OfflineCacheMiss, RegulationsCache, get_default_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Responses are cached on disk (regulations_cache.py) unless NAVI_REGULATIONS_CACHE=0
+CACHE_ENABLED = os.getenv('NAVI_REGULATIONS_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+# Every instance in the process shares one token bucket, since the quota belongs to the API key.
+# Starts at NAVI_REGULATIONS_RATE_LIMIT requests/hour and follows the X-RateLimit-* headers.
+RATE_LIMIT_PER_HOUR = int(os.getenv('NAVI_REGULATIONS_RATE_LIMIT', '1000'))
+shared_rate_limiter = TokenBucket(RATE_LIMIT_PER_HOUR, 3600)
+
+# Per-request deadline in seconds, covering rate-limit waits, retries and the responses themselves
+REQUEST_DEADLINE = float(os.getenv('NAVI_REGULATIONS_DEADLINE', '60'))
+CONNECT_TIMEOUT = 10
+MAX_RETRIES = 4
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Comments are kept in the local comment store (comment_store.py) unless NAVI_COMMENT_STORE=0.
+# A document synced less than COMMENT_SYNC_INTERVAL seconds ago is served without any request.
+COMMENT_STORE_ENABLED = os.getenv('NAVI_COMMENT_STORE', '1').lower() not in ('0', 'false', 'no')
+COMMENT_SYNC_INTERVAL = float(os.getenv('NAVI_COMMENT_SYNC_INTERVAL', '900'))
+# Until a document is fully copied, analyses are answered from a direct fetch of its newest comments
+# and a background backfill copies it in steps of BACKFILL_STEP comments (one request each). Before
+# each step the backfill waits until the rate limiter could pay for the step and still keep
+# BACKFILL_RESERVE of the quota for foreground requests, so large dockets are copied over hours
+# without starving analyses. Each step resumes from the high-water mark.
+BACKFILL_STEP = int(os.getenv('NAVI_COMMENT_BACKFILL_STEP', '250'))
+BACKFILL_RESERVE = float(os.getenv('NAVI_COMMENT_BACKFILL_RESERVE', '0.5'))
+
+# Documents with a background backfill queued or running
+_backfills = set()
+_backfills_lock = threading.Lock()
+
+# Comment details take one request per comment, so they are fetched in parallel.
+# Kept modest: regulations.gov keys are rate limited per hour, not per connection.
+DETAIL_FETCH_WORKERS = int(os.getenv('NAVI_REGULATIONS_WORKERS', '8'))
+
+# The comment list serves at most 250 entries per page and 20 pages (5,000 entries) per query
+LIST_PAGE_SIZE = 250
+MAX_PAGE_NUMBER = 20
+
+try:
+    # lastModifiedDate filters are interpreted in Eastern time
+    FILTER_TIMEZONE = ZoneInfo('America/New_York')
+except ZoneInfoNotFoundError:
+    # Without tz data use EST year-round: during DST the filter starts an hour early, which only
+    # re-lists comments that are then skipped as already seen
+    FILTER_TIMEZONE = timezone(timedelta(hours=-5))
+
+def _to_filter_timestamp(iso_timestamp: str) -> str:
+    """Convert an ISO timestamp (as returned in lastModifiedDate) to the filter format, in Eastern time"""
+    moment = datetime.fromisoformat(iso_timestamp.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(FILTER_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
+
+class RateLimitError(ValueError):
+    """regulations.gov answered 429 Too Many Requests"""
+
 @dataclass
 class RegulationsComment:
     """Data class representing a regulations.gov comment"""
@@ -31,6 +98,7 @@ class RegulationsComment:
     title: Optional[str] = None
     docket_id: str = ""
     agency_id: str = ""
+    last_modified_date: str = ""
 
 @dataclass
 class CommentAnalysis:
@@ -42,21 +110,53 @@ class CommentAnalysis:
     summary: str
     total_comments_analyzed: int
 
+@dataclass
+class CommentFetchReport:
+    """Comments fetched for a document, in list order, plus the comments whose details failed"""
+    document_id: str
+    comments: List[RegulationsComment] = field(default_factory=list)
+    failures: Dict[str, str] = field(default_factory=dict)
+    total_listed: int = 0
+
 class RegulationsGovAPI:
     """Main class for interacting with regulations.gov API and providing analysis"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, cache: Union[RegulationsCache, bool] = True,
+                 rate_limiter: Union[TokenBucket, bool] = True, comment_store: Union[CommentStore, bool] = True):
         # If no API key provided, try to get it from localStorage equivalent
         if api_key is None:
             api_key = self._get_api_key_from_config()
         
         self.api_key = api_key
+        # True shares the process-wide response cache, False disables caching
+        if cache is True:
+            cache = get_default_cache() if CACHE_ENABLED else None
+        self.cache: Optional[RegulationsCache] = cache or None
+        # True uses the process-wide limiter, False disables client-side limiting
+        if rate_limiter is True:
+            rate_limiter = shared_rate_limiter
+        self.rate_limiter: Optional[TokenBucket] = rate_limiter or None
+        # True uses the process-wide local comment store, False always fetches from the API
+        if comment_store is True:
+            comment_store = get_default_store() if COMMENT_STORE_ENABLED else None
+        self.comment_store: Optional[CommentStore] = comment_store or None
         self.base_url = "https://api.regulations.gov/v4"
         self.session = requests.Session()
         self.session.headers.update({
             'Accept': 'application/json',
             'User-Agent': 'Navi-Regulatory-Analysis/1.0'
         })
+        self._pool_size = 0
+        self._ensure_pool_size(DETAIL_FETCH_WORKERS)
+    
+    def _ensure_pool_size(self, workers: int):
+        """Keep one pooled connection per detail worker, so parallel fetches reuse their connections"""
+        if workers <= self._pool_size:
+            return
+        self._pool_size = max(workers, 10)
+        adapter = HTTPAdapter(pool_maxsize=self._pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
     
     def _get_api_key_from_config(self) -> str:
         """
@@ -85,25 +185,82 @@ class RegulationsGovAPI:
             
             raise ValueError("No regulations.gov API key configured. Please add your API key in Settings.")
     
-    def _make_request(self, url: str) -> Optional[Dict[str, Any]]:
-        """Make a request to the regulations.gov API with error handling"""
+    def _cached_response(self, url: str) -> Optional[Dict[str, Any]]:
         try:
-            response = self.session.get(url)
+            return self.cache.get(url)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+    
+    def _make_request(self, url: str) -> Optional[Dict[str, Any]]:
+        """Make a request to the regulations.gov API with error handling, going through the response cache"""
+        if self.cache is not None:
+            data = self._cached_response(url)
+            if data is not None:
+                return data
+            if self.cache.offline:
+                raise OfflineCacheMiss("Offline mode: this regulations.gov response is not cached.")
+        
+        data = self._fetch(url)
+        if self.cache is not None and data is not None:
+            try:
+                self.cache.put(url, data)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {e}")
+        return data
+    
+    def _fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Request a URL from the regulations.gov API, raising ValueError on errors.
+        Waits for the shared rate limiter, retries 429/5xx and connection failures with jittered
+        exponential backoff (or the server's Retry-After), and gives up after REQUEST_DEADLINE seconds.
+        """
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None and not self.rate_limiter.acquire(timeout=deadline - time.monotonic()):
+                raise RateLimitError("API rate limit reached and no request slot is free before the deadline.")
+            
+            try:
+                response = self.session.get(url, timeout=(CONNECT_TIMEOUT, max(deadline - time.monotonic(), 1.0)))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = backoff_delay(attempt)
+                if attempt < MAX_RETRIES and time.monotonic() + delay < deadline:
+                    logger.warning(f"Request failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                logger.error(f"Request failed: {e}")
+                raise ValueError(f"Failed to connect to regulations.gov API: {e}")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Request failed: {e}")
+                raise ValueError(f"Failed to connect to regulations.gov API: {e}")
+            
+            if self.rate_limiter is not None:
+                self.rate_limiter.update_from_headers(response.headers)
+            
+            if response.status_code == 429 or response.status_code in RETRY_STATUSES:
+                delay = retry_after_seconds(response.headers)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                if response.status_code == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.pause(delay)
+                if attempt < MAX_RETRIES and time.monotonic() + delay < deadline:
+                    logger.warning(f"HTTP {response.status_code} from regulations.gov, retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
             
             if response.status_code == 401:
                 raise ValueError("Invalid regulations.gov API key. Please check your API key.")
             elif response.status_code == 403:
                 raise ValueError("API key access denied. Please verify your regulations.gov API key permissions.")
             elif response.status_code == 429:
-                raise ValueError("API rate limit exceeded. Please try again later.")
+                raise RateLimitError("API rate limit exceeded. Please try again later.")
             elif not response.ok:
                 raise ValueError(f"HTTP {response.status_code}: {response.reason}")
             
             return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request failed: {e}")
-            raise ValueError(f"Failed to connect to regulations.gov API: {e}")
     
     def get_document_object_id(self, document_id: str) -> Optional[str]:
         """Get document objectId from documentId"""
@@ -152,94 +309,374 @@ class RegulationsGovAPI:
             logger.warning(f"Error getting comment count for document {document_id}: {e}")
             return 0
     
+    def _fetch_comment_details(self, comment_id: str) -> Optional[RegulationsComment]:
+        """Fetch comment details for a specific comment ID, raising on request errors"""
+        url = f"{self.base_url}/comments/{comment_id}?api_key={self.api_key}"
+        data = self._make_request(url)
+        
+        if data and 'data' in data:
+            comment_data = data['data']
+            attributes = comment_data.get('attributes', {})
+            
+            return RegulationsComment(
+                id=comment_data.get('id', ''),
+                comment_on_document_id=attributes.get('commentOnDocumentId', ''),
+                comment_text=attributes.get('comment', '') or attributes.get('commentText', ''),
+                submitter_name=attributes.get('submitterName'),
+                organization_name=attributes.get('organizationName'),
+                first_name=attributes.get('firstName'),
+                last_name=attributes.get('lastName'),
+                posted_date=attributes.get('postedDate', ''),
+                title=attributes.get('title'),
+                docket_id=attributes.get('docketId', ''),
+                agency_id=attributes.get('agencyId', ''),
+                last_modified_date=attributes.get('lastModifiedDate', '')
+            )
+        
+        return None
+    
     def fetch_comment_details(self, comment_id: str) -> Optional[RegulationsComment]:
         """Fetch comment details for a specific comment ID"""
         try:
-            url = f"{self.base_url}/comments/{comment_id}?api_key={self.api_key}"
-            data = self._make_request(url)
-            
-            if data and 'data' in data:
-                comment_data = data['data']
-                attributes = comment_data.get('attributes', {})
-                
-                return RegulationsComment(
-                    id=comment_data.get('id', ''),
-                    comment_on_document_id=attributes.get('commentOnDocumentId', ''),
-                    comment_text=attributes.get('comment', '') or attributes.get('commentText', ''),
-                    submitter_name=attributes.get('submitterName'),
-                    organization_name=attributes.get('organizationName'),
-                    first_name=attributes.get('firstName'),
-                    last_name=attributes.get('lastName'),
-                    posted_date=attributes.get('postedDate', ''),
-                    title=attributes.get('title'),
-                    docket_id=attributes.get('docketId', ''),
-                    agency_id=attributes.get('agencyId', '')
-                )
-            
-            return None
-            
+            return self._fetch_comment_details(comment_id)
         except Exception as e:
             logger.warning(f"Error fetching details for comment {comment_id}: {e}")
             return None
     
-    def fetch_comments_by_document_id(self, document_id: str, max_comments: int = 30) -> List[RegulationsComment]:
-        """Fetch comments directly filtered by document objectId"""
-        try:
-            # Step 1: Get the document's objectId
-            object_id = self.get_document_object_id(document_id)
-            if not object_id:
-                logger.info(f"No objectId found for document, no comments available: {document_id}")
-                return []
-            
-            # Step 2: Get list of comment IDs filtered by commentOnId
-            url = (f"{self.base_url}/comments"
-                   f"?filter%5BcommentOnId%5D={object_id}"
-                   f"&page%5Bsize%5D={max_comments}"
-                   f"&sort=-postedDate"
-                   f"&api_key={self.api_key}")
-            
-            logger.info(f"Getting comment list for document objectId (limited to {max_comments}): {document_id}")
-            
-            data = self._make_request(url)
-            if not data or 'data' not in data:
-                logger.info(f"No comments found for document: {document_id}")
-                return []
-            
-            comment_summaries = data['data']
-            if not comment_summaries:
-                logger.info(f"No comments found for document: {document_id}")
-                return []
-            
-            logger.info(f"Found {len(comment_summaries)} comment IDs for document {document_id}")
-            
-            # Step 3: Get full details for each comment
-            comment_details = []
-            comments_to_process = min(len(comment_summaries), max_comments)
-            
-            if len(comment_summaries) > max_comments:
-                logger.warning(f"Document has {len(comment_summaries)} comments, limiting to {max_comments} most recent comments")
-            
-            for i in range(comments_to_process):
-                comment_summary = comment_summaries[i]
-                try:
-                    comment_id = comment_summary['id']
-                    logger.info(f"Getting full details for comment {comment_id}")
-                    
-                    comment_detail = self.fetch_comment_details(comment_id)
-                    if comment_detail and comment_detail.comment_on_document_id == document_id:
-                        comment_details.append(comment_detail)
-                        logger.info(f"Successfully fetched full details for comment {comment_id}")
-                    else:
-                        logger.warning(f"Comment {comment_id} is not for document {document_id}, skipping")
-                        
-                except Exception as e:
-                    logger.warning(f"Error fetching details for comment {comment_summary.get('id', 'unknown')}: {e}")
-            
-            limit_message = f" (limited from {len(comment_summaries)} total comments)" if len(comment_summaries) > max_comments else ""
-            logger.info(f"Successfully fetched {len(comment_details)} full comment details for document {document_id}{limit_message}")
+    def fetch_comment_details_many(self, comment_ids: List[str], max_workers: Optional[int] = None):
+        """
+        Fetch details for many comments with at most max_workers requests in flight.
+        Returns (details, failures): details[i] belongs to comment_ids[i] (None if it failed or had
+        no data) and failures maps comment id -> error. After a 429 no new requests are started;
+        the comments not yet fetched are reported as failures instead.
+        """
+        workers = max(1, min(max_workers or DETAIL_FETCH_WORKERS, len(comment_ids) or 1))
+        details: List[Optional[RegulationsComment]] = [None] * len(comment_ids)
+        failures: Dict[str, str] = {}
+        rate_limited = threading.Event()
+        
+        def fetch(index: int, comment_id: str):
+            if rate_limited.is_set():
+                failures[comment_id] = "Skipped after API rate limit was exceeded"
+                return
+            try:
+                details[index] = self._fetch_comment_details(comment_id)
+            except RateLimitError as e:
+                rate_limited.set()
+                failures[comment_id] = str(e)
+            except Exception as e:
+                failures[comment_id] = str(e)
+        
+        self._ensure_pool_size(workers)
+        if workers == 1:
+            for index, comment_id in enumerate(comment_ids):
+                fetch(index, comment_id)
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='regulations-details') as executor:
+                for index, comment_id in enumerate(comment_ids):
+                    executor.submit(fetch, index, comment_id)
+        
+        if failures:
+            logger.warning(f"Failed to fetch details for {len(failures)} of {len(comment_ids)} comments")
+        return details, failures
+    
+    def _list_comments_page(self, object_id: str, sort: str, page_number: int, page_size: int,
+                            modified_since: Optional[str] = None) -> Dict[str, Any]:
+        """One page of the comment list for a document objectId"""
+        url = (f"{self.base_url}/comments"
+               f"?filter%5BcommentOnId%5D={object_id}"
+               f"&page%5Bsize%5D={page_size}"
+               f"&page%5Bnumber%5D={page_number}"
+               f"&sort={sort}"
+               f"&api_key={self.api_key}")
+        if modified_since:
+            url += f"&filter%5BlastModifiedDate%5D%5Bge%5D={quote(modified_since)}"
+        return self._make_request(url) or {}
+    
+    def iter_comment_summaries(self, object_id: str, newest_first: bool = False,
+                               modified_since: Optional[str] = None, page_size: int = LIST_PAGE_SIZE,
+                               meta: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yield comment list entries for a document objectId, page by page.
+
+        The API serves at most MAX_PAGE_NUMBER pages per query. Oldest-first (by lastModifiedDate)
+        walks the whole list: when a query runs out of pages, the next one starts at the last
+        lastModifiedDate seen, skipping the comments already yielded at that instant. newest_first
+        (by postedDate) cannot be windowed and stops after MAX_PAGE_NUMBER pages.
+        modified_since is an ISO timestamp; only comments modified at or after it are listed.
+        meta, if given, is updated with the first page's meta (e.g. totalElements).
+        """
+        page_size = max(1, min(page_size, LIST_PAGE_SIZE))
+        sort = '-postedDate' if newest_first else 'lastModifiedDate,documentId'
+        window_start = modified_since
+        # Comments already yielded with lastModifiedDate == boundary
+        boundary, boundary_ids = None, set()
+        
+        while True:
+            window_yielded = 0
+            for page_number in range(1, MAX_PAGE_NUMBER + 1):
+                data = self._list_comments_page(object_id, sort, page_number, page_size,
+                                                _to_filter_timestamp(window_start) if window_start else None)
+                if meta is not None and not meta:
+                    meta.update(data.get('meta') or {})
+                    meta.setdefault('totalElements', 0)
+                summaries = data.get('data') or []
+                for summary in summaries:
+                    if not newest_first:
+                        modified = (summary.get('attributes') or {}).get('lastModifiedDate') or ''
+                        if boundary is not None and (modified < boundary or
+                                                     (modified == boundary and summary.get('id') in boundary_ids)):
+                            continue
+                        if modified != boundary:
+                            boundary, boundary_ids = modified, set()
+                        boundary_ids.add(summary.get('id'))
+                    window_yielded += 1
+                    yield summary
+                
+                page_meta = data.get('meta') or {}
+                if len(summaries) < page_size:
+                    return
+                if page_number < MAX_PAGE_NUMBER and not page_meta.get('hasNextPage', True):
+                    return
             
-            return comment_details
+            # The last page of this query was full; more entries only exist past the page limit
+            if page_meta.get('totalElements', MAX_PAGE_NUMBER * page_size + 1) <= MAX_PAGE_NUMBER * page_size:
+                return
+            if newest_first:
+                logger.warning(f"Comment list for {object_id} has more than {MAX_PAGE_NUMBER * page_size} entries; "
+                               f"newest-first listing stops there")
+                return
+            if not window_yielded or boundary == window_start:
+                # A single timestamp holds a full window of comments; moving on would skip some
+                logger.warning(f"Cannot page past lastModifiedDate {boundary} for {object_id}; stopping")
+                return
+            logger.info(f"Comment list for {object_id} continues after {boundary}")
+            window_start = boundary
+    
+    def _iter_comment_chunks(self, document_id: str, summaries: Iterator[Dict[str, Any]],
+                             max_workers: Optional[int], failures: Dict[str, str]) -> Iterator[List[RegulationsComment]]:
+        """Fetch details one list page at a time, yielding each page's comments in list order"""
+        while True:
+            comment_ids = [summary['id'] for summary in islice(summaries, LIST_PAGE_SIZE) if summary.get('id')]
+            if not comment_ids:
+                return
+            details, chunk_failures = self.fetch_comment_details_many(comment_ids, max_workers)
+            failures.update(chunk_failures)
             
+            comments = []
+            for comment_id, comment_detail in zip(comment_ids, details):
+                if comment_detail and comment_detail.comment_on_document_id == document_id:
+                    comments.append(comment_detail)
+                elif comment_id not in chunk_failures:
+                    logger.warning(f"Comment {comment_id} is not for document {document_id}, skipping")
+            yield comments
+    
+    def iter_comments(self, document_id: str, max_comments: Optional[int] = None,
+                      modified_since: Optional[str] = None, max_workers: Optional[int] = None,
+                      failures: Optional[Dict[str, str]] = None) -> Iterator[RegulationsComment]:
+        """
+        Lazily yield every comment on a document, oldest modification first, with full details.
+        Only one list page of comments is held at a time. Comments whose details could not be
+        fetched are skipped and recorded in failures (comment id -> error) if a dict is given.
+        """
+        object_id = self.get_document_object_id(document_id)
+        if not object_id:
+            logger.info(f"No objectId found for document, no comments available: {document_id}")
+            return
+        
+        summaries = self.iter_comment_summaries(object_id, modified_since=modified_since)
+        if max_comments is not None:
+            summaries = islice(summaries, max_comments)
+        for comments in self._iter_comment_chunks(document_id, summaries, max_workers,
+                                                  failures if failures is not None else {}):
+            yield from comments
+    
+    def fetch_comments_report(self, document_id: str, max_comments: int = 30,
+                              max_workers: Optional[int] = None) -> CommentFetchReport:
+        """Fetch the most recent comments filtered by document objectId, reporting the ones whose details failed"""
+        report = CommentFetchReport(document_id=document_id)
+        
+        # Step 1: Get the document's objectId
+        object_id = self.get_document_object_id(document_id)
+        if not object_id:
+            logger.info(f"No objectId found for document, no comments available: {document_id}")
+            return report
+        
+        # Step 2: List comment IDs filtered by commentOnId, newest first, across as many pages as needed
+        logger.info(f"Getting comment list for document objectId (limited to {max_comments}): {document_id}")
+        meta: Dict[str, Any] = {}
+        summaries = islice(self.iter_comment_summaries(object_id, newest_first=True,
+                                                       page_size=min(max_comments, LIST_PAGE_SIZE), meta=meta),
+                           max_comments)
+        
+        # Step 3: Get full details for each comment, in parallel
+        for comments in self._iter_comment_chunks(document_id, summaries, max_workers, report.failures):
+            report.comments.extend(comments)
+        report.total_listed = meta.get('totalElements', 0)
+        
+        if not report.comments and not report.failures:
+            logger.info(f"No comments found for document: {document_id}")
+            return report
+        
+        limit_message = f" (limited from {report.total_listed} total comments)" if report.total_listed > max_comments else ""
+        logger.info(f"Successfully fetched {len(report.comments)} full comment details for document {document_id}{limit_message}")
+        
+        return report
+    
+    def sync_comments(self, document_id: str, max_workers: Optional[int] = None,
+                      max_comments: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Copy a document's comments into the local comment store. The first sync walks the whole
+        comment list; later ones only request comments modified at or after the high-water mark.
+        The mark advances after each stored batch unless a comment's details failed, so a
+        failed, interrupted or max_comments-limited sync is picked up again by the next one.
+        The document only counts as synced ('complete') once a sync reaches the end of the list.
+        """
+        store = self.comment_store
+        if store is None:
+            raise ValueError("No local comment store configured.")
+        if self.cache is not None and self.cache.offline:
+            raise OfflineCacheMiss("Offline mode: comments cannot be synced.")
+        
+        state = store.sync_state(document_id)
+        since = state['high_water_mark'] if state else None
+        logger.info(f"Syncing comments for document {document_id}" + (f" modified since {since}" if since else ""))
+        
+        # Bypass the response cache: it would return a changed comment as it was when first cached
+        api = RegulationsGovAPI(self.api_key, cache=False, rate_limiter=self.rate_limiter or False, comment_store=False)
+        api.base_url = self.base_url
+        
+        failures: Dict[str, str] = {}
+        high_water_mark = since
+        stored = 0
+        batch: List[RegulationsComment] = []
+        
+        def flush():
+            nonlocal high_water_mark, stored
+            stored += store.upsert(batch)
+            if not failures:
+                newest = max((comment.last_modified_date for comment in batch if comment.last_modified_date), default=None)
+                if newest and (high_water_mark is None or newest > high_water_mark):
+                    high_water_mark = newest
+                    store.advance_high_water_mark(document_id, high_water_mark)
+            batch.clear()
+        
+        listed = 0
+        for comment in api.iter_comments(document_id, max_comments=max_comments, modified_since=since,
+                                         max_workers=max_workers, failures=failures):
+            listed += 1
+            batch.append(comment)
+            if len(batch) >= LIST_PAGE_SIZE:
+                flush()
+        if batch:
+            flush()
+        # Fewer than max_comments listed means the walk reached the end of the comment list
+        complete = max_comments is None or listed + len(failures) < max_comments
+        if complete:
+            store.record_sync(document_id)
+        
+        logger.info(f"Synced {stored} new or changed comments for document {document_id}"
+                    + (f" ({len(failures)} failed, retried on the next sync)" if failures else "")
+                    + ("" if complete else " (more to come)"))
+        return {
+            'document_id': document_id,
+            'since': since,
+            'synced': stored,
+            'failures': failures,
+            'complete': complete,
+            'high_water_mark': high_water_mark,
+            'stored_total': store.count(document_id),
+        }
+    
+    def _stored_comments(self, document_id: str, max_comments: int) -> List[RegulationsComment]:
+        return [RegulationsComment(
+            id=row['comment_id'],
+            comment_on_document_id=row['document_id'],
+            comment_text=row['comment_text'] or '',
+            submitter_name=row['submitter_name'],
+            organization_name=row['organization_name'],
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            posted_date=row['posted_date'] or '',
+            title=row['title'],
+            docket_id=row['docket_id'] or '',
+            agency_id=row['agency_id'] or '',
+            last_modified_date=row['last_modified_date'] or ''
+        ) for row in self.comment_store.comments(document_id, max_comments)]
+    
+    def _comments_from_store(self, document_id: str, max_comments: int,
+                             max_workers: Optional[int]) -> Optional[List[RegulationsComment]]:
+        """Newest comments from the local store after a delta sync if one is due, or None to use the API"""
+        store = self.comment_store
+        state = store.sync_state(document_id)
+        
+        if self.cache is not None and self.cache.offline:
+            return self._stored_comments(document_id, max_comments) if state else None
+        
+        last_synced = state and state['last_synced_at']
+        if not last_synced:
+            # Not fully copied yet: answer from a direct fetch and continue (or start) the backfill
+            comments = self.fetch_comments_report(document_id, max_comments, max_workers).comments
+            store.upsert(comments)
+            self.backfill_comments(document_id, max_workers)
+            return comments
+        
+        if (datetime.now(timezone.utc) - datetime.fromisoformat(last_synced)).total_seconds() >= COMMENT_SYNC_INTERVAL:
+            self.sync_comments(document_id, max_workers)
+        return self._stored_comments(document_id, max_comments)
+    
+    def _wait_for_backfill_budget(self):
+        """Block until the rate limiter can pay for a backfill step and keep BACKFILL_RESERVE of its quota"""
+        limiter = self.rate_limiter
+        if limiter is None:
+            return
+        while True:
+            stats = limiter.stats()
+            needed = min(stats['limit'], BACKFILL_STEP + BACKFILL_RESERVE * stats['limit'])
+            if stats['tokens'] >= needed:
+                return
+            time.sleep((needed - stats['tokens']) / limiter.rate)
+    
+    def backfill_comments(self, document_id: str, max_workers: Optional[int] = None) -> bool:
+        """
+        Copy a document into the store on a background thread, BACKFILL_STEP comments at a time,
+        until a step reaches the end of the comment list. False if a backfill for the document is
+        already running. A backfill stopped by a failure or a restart is continued by the next
+        analysis of the document.
+        """
+        with _backfills_lock:
+            if document_id in _backfills:
+                return False
+            _backfills.add(document_id)
+        
+        def backfill():
+            try:
+                while True:
+                    self._wait_for_backfill_budget()
+                    result = self.sync_comments(document_id, max_workers, max_comments=BACKFILL_STEP)
+                    # After a failure the mark stays put; stepping on would re-list the same comments
+                    if result['complete'] or result['failures']:
+                        break
+            except Exception as e:
+                # The high-water mark keeps what was stored; the next analysis starts another backfill
+                logger.error(f"Background comment sync failed for document {document_id}: {e}")
+            finally:
+                with _backfills_lock:
+                    _backfills.discard(document_id)
+        
+        # Daemon thread: an interrupted sync resumes from the high-water mark next time
+        threading.Thread(target=backfill, name=f"comment-backfill-{document_id}", daemon=True).start()
+        return True
+    
+    def fetch_comments_by_document_id(self, document_id: str, max_comments: int = 30,
+                                      max_workers: Optional[int] = None) -> List[RegulationsComment]:
+        """Fetch comments for a document, most recent first, from the local store when one is configured"""
+        try:
+            if self.comment_store is not None:
+                comments = self._comments_from_store(document_id, max_comments, max_workers)
+                if comments is not None:
+                    return comments
+            return self.fetch_comments_report(document_id, max_comments, max_workers).comments
         except Exception as e:
             logger.error(f"Error fetching comments by document ID: {e}")
             raise
@@ -258,17 +695,19 @@ class RegulationsGovAPI:
     
     def test_api_connection(self) -> str:
         """Test regulations.gov API connection"""
+        if self.cache is not None and self.cache.offline:
+            raise ValueError("Offline mode: regulations.gov is not contacted.")
         try:
-            # Try dockets endpoint first
+            # Try dockets endpoint first; always from the network, a cached answer says nothing about the key
             test_url = f"{self.base_url}/dockets?filter%5BagencyId%5D=EPA&page%5Bsize%5D=5&api_key={self.api_key}"
-            data = self._make_request(test_url)
+            data = self._fetch(test_url)
             
             if data:
                 return "API key is valid and working!"
             else:
                 # Fallback to comments endpoint
                 comments_url = f"{self.base_url}/comments?filter%5BagencyId%5D=EPA&page%5Bsize%5D=5&api_key={self.api_key}"
-                comments_data = self._make_request(comments_url)
+                comments_data = self._fetch(comments_url)
                 
                 if comments_data:
                     return "API key is valid! (Limited access - dockets endpoint restricted)"
@@ -0,0 +1,108 @@
+"""
+Request Body Streaming
+Incremental readers for large request bodies: Content-Length or chunked framing,
+gzip/zstd Content-Encoding, and newline-delimited JSON parsing
+"""
+
+import json
+import zlib
+from typing import Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd-encoded uploads are rejected without it; gzip is always available
+    zstandard = None
+
+READ_SIZE = 64 * 1024
+
+
+class UnsupportedEncoding(ValueError):
+    """The request used a Content-Encoding this server cannot decode"""
+
+
+def iter_body(rfile, headers) -> Iterator[bytes]:
+    """Yield the raw request body in pieces, honouring chunked transfer encoding or Content-Length"""
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        while True:
+            size_line = rfile.readline(1024)
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Skip any trailer headers up to the terminating blank line
+                while rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            remaining = size
+            while remaining:
+                piece = rfile.read(min(remaining, READ_SIZE))
+                if not piece:
+                    raise ValueError("Request body ended inside a chunk")
+                remaining -= len(piece)
+                yield piece
+            rfile.readline(1024)
+        return
+
+    remaining = int(headers.get('Content-Length') or 0)
+    while remaining:
+        piece = rfile.read(min(remaining, READ_SIZE))
+        if not piece:
+            raise ValueError("Request body shorter than Content-Length")
+        remaining -= len(piece)
+        yield piece
+
+
+def _decompressor(encoding: str):
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(31)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding: {encoding}")
+
+
+def decode_body(pieces: Iterator[bytes], content_encoding: Optional[str]) -> Iterator[bytes]:
+    """Undo Content-Encoding incrementally, so a compressed upload is never held in memory whole"""
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        yield from pieces
+        return
+    decompressor = _decompressor(encoding)
+    decompression_errors = (zlib.error, EOFError) if zstandard is None else (zlib.error, EOFError, zstandard.ZstdError)
+    try:
+        for piece in pieces:
+            data = decompressor.decompress(piece)
+            if data:
+                yield data
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+        if not getattr(decompressor, 'eof', True):
+            raise ValueError(f"Truncated {encoding} body")
+    except decompression_errors as e:
+        raise ValueError(f"Could not decode {encoding} body: {e}") from e
+
+
+def iter_ndjson(pieces: Iterator[bytes]) -> Iterator[Tuple[int, object]]:
+    """
+    Parse newline-delimited JSON from byte pieces, yielding (line_number, value).
+    Malformed lines yield (line_number, ValueError) so the caller can report them and carry on.
+    """
+    buffer = b''
+    line_number = 0
+    for piece in pieces:
+        buffer += piece
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, _parse_line(line)
+    if buffer.strip():
+        yield line_number + 1, _parse_line(buffer)
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(str(e))
@@ -0,0 +1,119 @@
+"""
+Response Cache
+Size-bounded LRU cache of serialized API responses with tag-based invalidation
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable, Optional, Set
+
+
+@dataclass
+class CachedResponse:
+    """
+    A serialized (and possibly compressed) 200 response. etag is the validator the body was built
+    under; it is kept out of headers so hits send the current ETag and entries from an older
+    table version are never served under a newer one.
+    """
+    body: bytes
+    encoding: Optional[str]
+    headers: Dict[str, str]
+    tags: Set[str] = field(default_factory=set)
+    etag: Optional[str] = None
+
+
+class ResponseCache:
+    """
+    LRU cache of response bytes bounded by total body size.
+
+    Entries carry tags (e.g. 'persona:3', 'documents'); writers call invalidate() with the tags
+    they touched. Readers take generation() before querying SQLite and pass it to put(): if any
+    invalidation happened in between, the response may predate the write and is not stored.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_fraction: float = 0.125):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * max_entry_fraction)
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResponse, generation: int):
+        if self.max_bytes <= 0 or len(entry.body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, tags: Iterable[str]):
+        """Drop every entry carrying any of the given tags"""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -1,18 +1,422 @@
 import sqlite3
 import json
-from datetime import datetime
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, parse_qsl
 import os
+import re
+import signal
+import threading
+import zlib
+from api_metrics import InstrumentedHandlerMixin, RequestMetrics, phase_timer, record_phase
+from http_compression import COMPRESSION_MIN_SIZE, StreamCompressor, choose_encoding, compress_body, dumps_compact
+from request_body import UnsupportedEncoding, decode_body, iter_body, iter_ndjson
+from ingest_jobs import IngestJobQueue
+import comment_store
+from response_cache import CachedResponse, ResponseCache
+from slow_query_log import SlowQueryLog
+from sqlite_timing import TimedConnection
+import sqlite_timing
+from embedding_codec import floats_from_base64, pack_embedding, pack_chunk_embeddings, unpack_embedding, repack_legacy_value
+from vector_search import ChunkEmbeddingMatrix, DocumentEmbeddingMatrix, PersistentANNIndex, numpy_available
 
 # Database setup
 DB_FILE = "navi.db"
 
+# Pragmas applied to every pooled connection. WAL lets readers proceed while a
+# bulk ingest holds the write lock; NORMAL sync is durable under WAL.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",      # 64 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+SQLITE_BUSY_TIMEOUT = 10.0
+# Compiled statements kept per connection; the handlers use a few dozen distinct queries
+SQLITE_STATEMENT_CACHE_SIZE = 256
+# Rows converted per transaction by the JSON -> float32 BLOB embedding migration
+EMBEDDING_MIGRATION_BATCH_SIZE = 200
+
+# Documents written per transaction by /documents/bulk and /api/upload
+UPSERT_BATCH_SIZE = 2000
+
+# Background ingest (?async=true on /documents/bulk and /api/upload). Uploads are spooled
+# here until their job completes; one worker keeps ingest from contending for the write lock.
+JOB_SPOOL_DIR = os.environ.get('NAVI_JOB_SPOOL_DIR', 'job_spool')
+JOB_WORKERS = int(os.environ.get('NAVI_JOB_WORKERS', '1'))
+
+# Full-text search over documents.title/text (FTS5, BM25 ranking)
+FTS_TITLE_WEIGHT = 10.0
+FTS_SNIPPET_TOKENS = 24
+FTS_ENABLED = False  # set by init_db once documents_fts exists
+
+# Hybrid search: candidates fetched from each retriever, and the reciprocal rank fusion constant
+HYBRID_CANDIDATES = 50
+RRF_K = 60
+hybrid_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='navi-hybrid')
+
+# Approximate-nearest-neighbour index over documents.embedding. NAVI_ANN_NPROBE is the
+# recall/latency knob: the number of IVF lists scanned per query (higher = closer to exact).
+ANN_INDEX_DIR = os.environ.get('NAVI_ANN_INDEX_DIR', 'ann_index')
+ANN_NPROBE = int(os.environ.get('NAVI_ANN_NPROBE', '8'))
+
+# Serialized responses of the read endpoints, invalidated by tag from the write handlers
+RESPONSE_CACHE_BYTES = int(float(os.environ.get('NAVI_RESPONSE_CACHE_MB', '64')) * 1024 * 1024)
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+
+# Statements on pooled connections taking at least NAVI_SLOW_QUERY_MS (statement plus fetches) are
+# logged with their query plan; the slowest NAVI_SLOW_QUERY_TOP are served at /debug/slow-queries.
+# A negative threshold disables the log.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('NAVI_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_TOP_N = int(os.environ.get('NAVI_SLOW_QUERY_TOP', '20'))
+slow_query_log = SlowQueryLog(SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_TOP_N)
+
+# Tables whose write counters (table_versions) back the ETags of the list endpoints
+VERSIONED_TABLES = ('documents', 'personas', 'matched_documents')
+
+# NDJSON streaming (?format=ndjson or Accept: application/x-ndjson): rows pulled from the
+# SQLite cursor and written per chunk, so memory stays bounded regardless of limit
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+NDJSON_BATCH_SIZE = 200
+# Per-line errors echoed back by an NDJSON upload; the rest are only counted
+NDJSON_MAX_REPORTED_ERRORS = 100
+
+# Server setup
+# Each worker thread serves one connection at a time; idle keep-alive
+# connections are dropped after KEEP_ALIVE_TIMEOUT seconds to free the worker.
+DEFAULT_WORKERS = int(os.environ.get('NAVI_API_WORKERS', '32'))
+KEEP_ALIVE_TIMEOUT = float(os.environ.get('NAVI_API_KEEP_ALIVE_TIMEOUT', '5'))
+
+_db_local = threading.local()
+_db_connections = []
+_db_connections_lock = threading.Lock()
+
+def get_db_connection():
+    """Return the calling thread's long-lived SQLite connection, opening it on first use"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and _db_local.db_file == DB_FILE:
+        if conn.in_transaction:
+            # A previous request on this thread failed before committing
+            conn.rollback()
+        return conn
+    
+    conn = sqlite3.connect(DB_FILE, timeout=SQLITE_BUSY_TIMEOUT,
+                           cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+                           check_same_thread=False, factory=TimedConnection)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    
+    _db_local.conn = conn
+    _db_local.db_file = DB_FILE
+    with _db_connections_lock:
+        _db_connections.append(conn)
+    return conn
+
+# Pooled connections report statement/fetch time into the current request's 'sqlite' phase (/metrics)
+sqlite_timing.observers.append(lambda sql, seconds: record_phase('sqlite', seconds))
+sqlite_timing.statement_observers.append(slow_query_log.observe)
+
+def release_db_connection(conn):
+    """Return a connection to the pool, discarding any uncommitted work"""
+    if conn.in_transaction:
+        conn.rollback()
+
+def close_db_connections():
+    """Close every pooled connection (called on server shutdown)"""
+    with _db_connections_lock:
+        for conn in _db_connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _db_connections.clear()
+    _db_local.__dict__.clear()
+
+# Columns returned by the document endpoints, in response order
+DOCUMENT_FIELDS = (
+    'id', 'document_id', 'title', 'text', 'agency_id', 'document_type',
+    'web_comment_link', 'web_document_link', 'web_docket_link', 'docket_id',
+    'embedding', 'chunk_embeddings', 'posted_date', 'comment_end_date'
+)
+EMBEDDING_FIELDS = ('embedding', 'chunk_embeddings')
+
+def select_document_fields(query_params):
+    """
+    Resolve the fields= / exclude= query parameters (comma-separated) into the
+    document columns to SELECT, so excluded columns are never read or decoded.
+    """
+    def parse(name):
+        values = query_params.get(name, [''])[0]
+        return [value.strip() for value in values.split(',') if value.strip()]
+    
+    requested = parse('fields')
+    excluded = parse('exclude')
+    unknown = [field for field in requested + excluded if field not in DOCUMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    
+    fields = [field for field in DOCUMENT_FIELDS if (not requested or field in requested) and field not in excluded]
+    if not fields:
+        raise ValueError("At least one field must be selected")
+    return fields
+
+def document_row_to_dict(fields, row):
+    """Build a document response from a row selected with select_document_fields()"""
+    result = {}
+    for field, value in zip(fields, row):
+        # Decode packed float32 embeddings (or legacy JSON)
+        result[field] = unpack_embedding(value) if field in EMBEDDING_FIELDS else value
+    return result
+
+def persona_row_to_dict(row):
+    """Build a persona response from a /personas row"""
+    return {
+        'id': row[0],
+        'name': row[1],
+        'role': row[2],
+        'location': row[3],
+        'age_range': row[4],
+        'employment_status': row[5],
+        'industry': row[6],
+        'policy_interests': json.loads(row[7]) if row[7] else [],
+        'preferred_agencies': json.loads(row[8]) if row[8] else [],
+        'impact_level': json.loads(row[9]) if row[9] else [],
+        'additional_context': row[10],
+        # Decode packed float32 embedding (or legacy JSON) if it exists
+        'embedding': unpack_embedding(row[11]),
+        'created_at': row[12],
+        'updated_at': row[13]
+    }
+
+def matched_document_row_to_dict(row):
+    """Build a matched-document response (with nested document details) from a /matched-documents row"""
+    return {
+        'id': row[0],
+        'persona_id': row[1],
+        'document_id': row[2],
+        'similarity_score': row[3],
+        'gpt_relevance_score': row[4],
+        'relevance_reason': row[5],
+        'gpt_reasoning': row[6],
+        'gpt_thought_process': row[7],
+        'created_at': row[8],
+        'document': {
+            'id': row[2],  # document_id
+            'document_id': row[2],
+            'title': row[9],
+            'text': row[10],
+            'agency_id': row[11],
+            'document_type': row[12],
+            'web_comment_link': row[13],
+            'web_document_link': row[14],
+            'web_docket_link': row[15],
+            'docket_id': row[16],
+            'posted_date': row[17],
+            'comment_end_date': row[18]
+        }
+    }
+
+def bump_table_versions(cursor, *tables):
+    """Advance the write counters behind the ETags; call inside the writer's transaction"""
+    cursor.executemany("UPDATE table_versions SET version = version + 1 WHERE table_name = ?",
+                       [(table,) for table in tables])
+
+def table_versions_etag(*tables, variant=''):
+    """Weak ETag built from the write counters of the given tables (no row data is read)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT table_name, version FROM table_versions
+        WHERE table_name IN ({', '.join('?' * len(tables))})
+    """, tables)
+    versions = dict(cursor.fetchall())
+    release_db_connection(conn)
+    return 'W/"' + '.'.join(f"{versions.get(table, 0):x}" for table in tables) + variant + '"'
+
+def encode_cursor(values):
+    """Opaque keyset pagination token for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+def decode_cursor(token, size):
+    """Decode a token from encode_cursor(), checking it holds the expected number of sort keys"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def documents_page_sql(fields, keyset=False):
+    """
+    One page of /documents, newest first. posted_date and id trail the projected fields so the
+    next cursor can be built; both forms walk idx_documents_posted_date instead of sorting the table.
+    Parameters: (posted_date, id, limit) with keyset, else (limit, offset).
+    """
+    if keyset:
+        return f"""
+            SELECT {', '.join(fields)}, posted_date, id
+            FROM documents
+            WHERE (posted_date, id) < (?, ?)
+            ORDER BY posted_date DESC, id DESC
+            LIMIT ?
+        """
+    return f"""
+        SELECT {', '.join(fields)}, posted_date, id
+        FROM documents
+        ORDER BY posted_date DESC, id DESC
+        LIMIT ? OFFSET ?
+    """
+
+def matched_documents_page_sql(keyset=False):
+    """
+    One page of a persona's matches with their document details. With keyset, resumes after the
+    last (gpt_relevance_score, similarity_score, id) seen; served by idx_matched_documents_persona_rank.
+    Parameters: (persona_id, [gpt_relevance_score, similarity_score, id,] limit).
+    """
+    condition = "AND (md.gpt_relevance_score, md.similarity_score, md.id) < (?, ?, ?)" if keyset else ""
+    return f"""
+        SELECT 
+            md.id,
+            md.persona_id,
+            md.document_id,
+            md.similarity_score,
+            md.gpt_relevance_score,
+            md.relevance_reason,
+            md.gpt_reasoning,
+            md.gpt_thought_process,
+            md.created_at,
+            d.title,
+            d.text,
+            d.agency_id,
+            d.document_type,
+            d.web_comment_link,
+            d.web_document_link,
+            d.web_docket_link,
+            d.docket_id,
+            d.posted_date,
+            d.comment_end_date
+        FROM matched_documents md
+        JOIN documents d ON md.document_id = d.document_id
+        WHERE md.persona_id = ? {condition}
+        ORDER BY md.gpt_relevance_score DESC, md.similarity_score DESC, md.id DESC
+        LIMIT ?
+    """
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 MATCH expression: every word must appear, FTS operators are neutralised"""
+    terms = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{term}"' for term in terms)
+
+def init_fts(cursor):
+    """Create the documents_fts index and its sync triggers, backfilling existing rows on first run"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'")
+    if cursor.fetchone():
+        return True
+    
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE documents_fts USING fts5(
+                title, text,
+                content='documents', content_rowid='id',
+                tokenize='porter unicode61'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable, falling back to LIKE search: {e}")
+        return False
+    
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+            INSERT INTO documents_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE OF title, text ON documents BEGIN
+            INSERT INTO documents_fts(documents_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+            INSERT INTO documents_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+        END
+    """)
+    
+    print("Building full-text index for existing documents...")
+    cursor.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+    print("Full-text index built.")
+    return True
+
+def build_document_filters(query_params, alias=''):
+    """SQL clauses for the optional agency / document_type / comment-window filters"""
+    clauses = []
+    params = []
+    agency = query_params.get('agency', [None])[0]
+    document_type = query_params.get('document_type', [None])[0]
+    comment_end_after = query_params.get('comment_end_after', [None])[0]
+    comment_end_before = query_params.get('comment_end_before', [None])[0]
+    
+    if query_params.get('open_for_comment', [''])[0].lower() in ('1', 'true', 'yes'):
+        comment_end_after = max(comment_end_after or '', datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S'))
+    
+    if agency:
+        clauses.append(f"{alias}agency_id = ?")
+        params.append(agency)
+    if document_type:
+        clauses.append(f"{alias}document_type = ?")
+        params.append(document_type)
+    if comment_end_after:
+        clauses.append(f"{alias}comment_end_date >= ?")
+        params.append(comment_end_after)
+    if comment_end_before:
+        clauses.append(f"{alias}comment_end_date <= ?")
+        params.append(comment_end_before)
+    return clauses, params
+
+def lexical_candidates(fts_query, filters, limit):
+    """BM25-ranked document ids (with snippets) for the lexical half of hybrid search"""
+    clauses, params = filters
+    where = ' AND '.join(['documents_fts MATCH ?'] + clauses)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT d.document_id, snippet(documents_fts, -1, '<mark>', '</mark>', '…', {FTS_SNIPPET_TOKENS})
+        FROM documents_fts
+        JOIN documents d ON d.id = documents_fts.rowid
+        WHERE {where}
+        ORDER BY bm25(documents_fts, {FTS_TITLE_WEIGHT}, 1.0)
+        LIMIT ?
+    """, [fts_query] + params + [limit])
+    rows = cursor.fetchall()
+    release_db_connection(conn)
+    return rows
+
+def vector_candidates(embedding, filters, limit, nprobe):
+    """Cosine-ranked (document_id, score) pairs for the vector half of hybrid search"""
+    clauses, params = filters
+    if not clauses:
+        return ann_index.search(embedding, limit, nprobe)
+    
+    # Filtered queries score only the matching documents exactly, so selective filters still fill the page
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT document_id FROM documents WHERE {' AND '.join(clauses)}", params)
+    allowed = {row[0] for row in cursor.fetchall()}
+    release_db_connection(conn)
+    return document_embeddings.search(embedding, limit, allowed=allowed)
+
 def init_db():
     """Initialize SQLite database with tables"""
+    global FTS_ENABLED
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     
+    # WAL is persistent in the database file, so setting it once here covers every pooled connection
+    cursor.execute("PRAGMA journal_mode = WAL")
+    
     # Create tables
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS personas (
@@ -27,7 +431,7 @@ def init_db():
             preferred_agencies TEXT DEFAULT '[]',
             impact_level TEXT DEFAULT '[]',
             additional_context TEXT,
-            embedding TEXT,
+            embedding BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -53,8 +457,8 @@ def init_db():
             web_document_link TEXT,
             web_docket_link TEXT,
             docket_id TEXT,
-            embedding TEXT,
-            chunk_embeddings TEXT,
+            embedding BLOB,
+            chunk_embeddings BLOB,
             posted_date TIMESTAMP,
             comment_end_date TIMESTAMP,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -111,7 +515,7 @@ def init_db():
     
     # Add embedding column to personas if it doesn't exist (migration)
     try:
-        cursor.execute("ALTER TABLE personas ADD COLUMN embedding TEXT")
+        cursor.execute("ALTER TABLE personas ADD COLUMN embedding BLOB")
         conn.commit()
     except sqlite3.OperationalError:
         # Column already exists, ignore
@@ -119,12 +523,63 @@ def init_db():
     
     # Add chunk_embeddings column to documents if it doesn't exist (migration)
     try:
-        cursor.execute("ALTER TABLE documents ADD COLUMN chunk_embeddings TEXT")
+        cursor.execute("ALTER TABLE documents ADD COLUMN chunk_embeddings BLOB")
         conn.commit()
     except sqlite3.OperationalError:
         # Column already exists, ignore
         pass
     
+    # Background ingest jobs (see ingest_jobs.py); spool_path holds the uploaded NDJSON until completion
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            status TEXT NOT NULL,
+            spool_path TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            errors TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            run_started_at TEXT,
+            run_start_processed INTEGER NOT NULL DEFAULT 0,
+            finished_at TEXT
+        )
+    """)
+    
+    # Local copy of regulations.gov public comments, filled by RegulationsGovAPI.sync_comments()
+    comment_store.create_tables(cursor)
+    
+    # Write counters behind the ETags of /documents, /personas and /matched-documents.
+    # They restart from the current time in ms (and always move forward), so validators
+    # issued before a restart or against a recreated database never match again.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    cursor.executemany("""
+        INSERT INTO table_versions (table_name, version) VALUES (?, ?)
+        ON CONFLICT(table_name) DO UPDATE SET version = MAX(version + 1, excluded.version)
+    """, [(table, now_ms) for table in VERSIONED_TABLES])
+    
+    # Indexes backing keyset pagination of /documents and /matched-documents
+    cursor.execute("UPDATE documents SET posted_date = '' WHERE posted_date IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_posted_date ON documents(posted_date DESC, id DESC)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_matched_documents_persona_rank
+        ON matched_documents(persona_id, gpt_relevance_score DESC, similarity_score DESC, id DESC)
+    """)
+    
+    # Full-text index (must exist before sample documents are inserted so the triggers see them)
+    FTS_ENABLED = init_fts(cursor)
+    
     # Insert sample data
     cursor.execute("""
         INSERT OR IGNORE INTO agencies (name, code) VALUES 
@@ -145,7 +600,221 @@ def init_db():
     conn.commit()
     conn.close()
 
-class APIHandler(BaseHTTPRequestHandler):
+# Document embeddings held in memory for /documents/similar
+document_embeddings = DocumentEmbeddingMatrix(get_db_connection)
+chunk_embeddings_matrix = ChunkEmbeddingMatrix(get_db_connection)
+ann_index = PersistentANNIndex(ANN_INDEX_DIR, get_db_connection, nprobe=ANN_NPROBE) if numpy_available() else None
+
+def on_document_embeddings_written(items, flush=True):
+    """Bring the embedding matrices and ANN index in step with committed (document_id, embedding) writes"""
+    document_embeddings.invalidate()
+    chunk_embeddings_matrix.invalidate()
+    if ann_index is not None:
+        ann_index.upsert(items)
+        # Files are written on the index's saver thread; run_server() flushes on shutdown
+        if flush:
+            ann_index.request_save()
+        else:
+            ann_index.maybe_save()
+
+def invalidate_document_responses(document_ids):
+    """Drop cached responses that include any of these documents, and every cached document list"""
+    response_cache.invalidate(['documents'] + [f"document:{document_id}" for document_id in document_ids])
+
+def on_document_embeddings_cleared():
+    """Drop all in-memory and on-disk vector state after documents or embeddings are cleared"""
+    document_embeddings.invalidate()
+    chunk_embeddings_matrix.invalidate()
+    if ann_index is not None:
+        ann_index.clear()
+
+def migrate_embeddings_to_blob(batch_size=EMBEDDING_MIGRATION_BATCH_SIZE):
+    """
+    Convert legacy JSON TEXT embeddings to packed float32 BLOBs.
+    Runs online in small batches; each row is only rewritten if it still holds
+    the value that was read, so concurrent API writes are never clobbered.
+    """
+    conn = sqlite3.connect(DB_FILE, timeout=SQLITE_BUSY_TIMEOUT)
+    migrated = 0
+    
+    try:
+        for table, column, matrix in (('documents', 'embedding', False),
+                                      ('documents', 'chunk_embeddings', True),
+                                      ('personas', 'embedding', False)):
+            # Cached responses and ETags name documents by document_id, personas by id
+            key = 'document_id' if table == 'documents' else 'id'
+            last_id = 0
+            while True:
+                rows = conn.execute(f"""
+                    SELECT id, {column}, {key} FROM {table}
+                    WHERE id > ? AND typeof({column}) = 'text'
+                    ORDER BY id LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                
+                updates = []
+                keys = []
+                for row_id, value, row_key in rows:
+                    try:
+                        updates.append((repack_legacy_value(value, matrix=matrix), row_id, value))
+                        keys.append(row_key)
+                    except (ValueError, TypeError) as e:
+                        # Left as TEXT: overwriting it with NULL would lose the value silently
+                        print(f"Skipping {table}.{column} for row {row_id}: {e}")
+                if not updates:
+                    continue
+                
+                # float32 values differ from the stored JSON, so served ETags and cached bodies go stale
+                with conn:
+                    cursor = conn.cursor()
+                    cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ? AND {column} IS ?", updates)
+                    bump_table_versions(cursor, table)
+                if table == 'documents':
+                    invalidate_document_responses(keys)
+                else:
+                    response_cache.invalidate(['personas'] + [f"persona:{persona_id}" for persona_id in keys])
+                migrated += len(updates)
+    finally:
+        conn.close()
+    
+    if migrated:
+        print(f"Embedding migration completed: {migrated} values converted to float32 BLOBs.")
+    return migrated
+
+UPSERT_DOCUMENT_COLUMNS = ('document_id', 'title', 'text', 'agency_id', 'document_type', 'web_comment_link',
+                           'web_document_link', 'web_docket_link', 'docket_id', 'embedding', 'posted_date',
+                           'comment_end_date')
+
+# Re-uploading an unchanged document is a no-op: the WHERE clause skips the row write
+# and with it the FTS delete/insert triggers
+UPSERT_DOCUMENT_SQL = f"""
+    INSERT INTO documents ({', '.join(UPSERT_DOCUMENT_COLUMNS)})
+    VALUES ({', '.join('?' * len(UPSERT_DOCUMENT_COLUMNS))})
+    ON CONFLICT(document_id) DO UPDATE SET
+        {', '.join(f'{column} = excluded.{column}' for column in UPSERT_DOCUMENT_COLUMNS[1:])}
+    WHERE ({', '.join(UPSERT_DOCUMENT_COLUMNS[1:])})
+        IS NOT ({', '.join(f'excluded.{column}' for column in UPSERT_DOCUMENT_COLUMNS[1:])})
+"""
+
+def normalize_document(doc):
+    """
+    Map an uploaded document (regulations.gov camelCase or snake_case keys) to an
+    UPSERT_DOCUMENT_COLUMNS row. Returns (row, embedding) so the caller can index the raw vector.
+    """
+    embedding = doc.get('embedding', [])
+    row = (
+        doc.get('documentId') or doc.get('document_id', ''),
+        doc.get('title', ''),
+        doc.get('text', ''),
+        doc.get('agencyId') or doc.get('agency_id', ''),
+        doc.get('documentType') or doc.get('document_type', ''),
+        doc.get('webCommentLink') or doc.get('web_comment_link', ''),
+        doc.get('webDocumentLink') or doc.get('web_document_link', ''),
+        doc.get('webDocketLink') or doc.get('web_docket_link', ''),
+        doc.get('docketId') or doc.get('docket_id', ''),
+        # Pack embedding array as a float32 BLOB for storage
+        pack_embedding(embedding, doc.get('embeddingModel') or doc.get('embedding_model')),
+        # Never NULL, so keyset pagination on (posted_date, id) sees every row
+        doc.get('postedDate') or doc.get('posted_date') or '',
+        doc.get('commentEndDate') or doc.get('comment_end_date', ''),
+    )
+    return row, embedding
+
+def upsert_documents(conn, documents, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Insert or update documents by document_id, one executemany() per batch and one
+    transaction per batch. If a batch fails it is retried row by row so the error can be
+    reported against the offending document while the rest of the batch is still stored.
+    Returns (inserted, updated, errors, indexed_embeddings).
+    """
+    cursor = conn.cursor()
+    inserted_count = 0
+    updated_count = 0
+    errors = []
+    indexed_embeddings = []
+    
+    for start in range(0, len(documents), batch_size):
+        rows = []
+        embeddings = []
+        for doc in documents[start:start + batch_size]:
+            try:
+                row, embedding = normalize_document(doc)
+            except Exception as e:
+                errors.append(f"Error processing document {doc.get('documentId', 'unknown')}: {str(e)}")
+                continue
+            rows.append(row)
+            embeddings.append((row[0], embedding))
+        if not rows:
+            continue
+        
+        # Which ids already exist decides the inserted/updated split reported to the client
+        batch_ids = list({row[0] for row in rows})
+        cursor.execute(f"""
+            SELECT document_id FROM documents
+            WHERE document_id IN ({', '.join('?' * len(batch_ids))})
+        """, batch_ids)
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        try:
+            cursor.executemany(UPSERT_DOCUMENT_SQL, rows)
+            stored = list(zip(rows, embeddings))
+        except sqlite3.Error:
+            conn.rollback()
+            stored = []
+            for row, embedding in zip(rows, embeddings):
+                try:
+                    cursor.execute(UPSERT_DOCUMENT_SQL, row)
+                    stored.append((row, embedding))
+                except sqlite3.Error as e:
+                    errors.append(f"Error processing document {row[0] or 'unknown'}: {str(e)}")
+        
+        for row, embedding in stored:
+            if row[0] in existing:
+                updated_count += 1
+            else:
+                inserted_count += 1
+                existing.add(row[0])
+            indexed_embeddings.append(embedding)
+        
+        bump_table_versions(cursor, 'documents')
+        conn.commit()
+        invalidate_document_responses(row[0] for row, _ in stored)
+    
+    return inserted_count, updated_count, errors, indexed_embeddings
+
+def ingest_document_batch(conn, documents):
+    """Store one batch for a background ingest job"""
+    inserted, updated, errors, indexed_embeddings = upsert_documents(conn, documents)
+    on_document_embeddings_written(indexed_embeddings, flush=False)
+    return inserted, updated, errors
+
+ingest_jobs = IngestJobQueue(JOB_SPOOL_DIR, get_db_connection, ingest_document_batch,
+                             batch_size=UPSERT_BATCH_SIZE, workers=JOB_WORKERS,
+                             on_finished=lambda: on_document_embeddings_written([]))
+
+# Route labels for /metrics; ids are folded into templates so label cardinality stays bounded
+API_ROUTES = [
+    (r'/documents/(search|similar|hybrid-search|bulk|clear|clear-embeddings|embedding|chunk-embeddings)',
+     r'/documents/\1'),
+    (r'/documents/embeddings/batch', '/documents/embeddings/batch'),
+    (r'/documents/[^/]+', '/documents/{id}'),
+    (r'/personas/embedding', '/personas/embedding'),
+    (r'/personas/[^/]+', '/personas/{id}'),
+    (r'/comments/[^/]+', '/comments/{id}'),
+    (r'/jobs/[^/]+', '/jobs/{id}'),
+    (r'/debug/slow-queries', '/debug/slow-queries'),
+    (r'/(health|documents|personas|comments|matched-documents|metrics|api/upload|cache/stats)', r'/\1'),
+]
+
+class APIHandler(InstrumentedHandlerMixin, BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests, so every response
+    # must carry a Content-Length (see _send_json_response)
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    request_metrics = RequestMetrics(API_ROUTES)
+    
     def do_GET(self):
         """Handle GET requests"""
         parsed_path = urlparse(self.path)
@@ -153,12 +822,8 @@ class APIHandler(BaseHTTPRequestHandler):
         query_params = parse_qs(parsed_path.query)
         
         if path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
             response = {"status": "healthy", "timestamp": datetime.now().isoformat()}
-            self.wfile.write(json.dumps(response).encode())
+            self._send_json_response(200, response)
             
         elif path == '/documents':
             self.get_documents(query_params)
@@ -167,11 +832,15 @@ class APIHandler(BaseHTTPRequestHandler):
             document_id = path.split('/')[-1]
             if document_id == 'search':
                 self.search_documents(query_params)
+            elif document_id == 'similar':
+                self.get_similar_documents(query_params)
+            elif document_id == 'hybrid-search':
+                self.hybrid_search_documents(query_params)
             else:
-                self.get_document(document_id)
+                self.get_document(document_id, query_params)
                 
         elif path == '/personas':
-            self.get_all_personas()
+            self.get_all_personas(query_params)
             
         elif path.startswith('/personas/'):
             persona_id = int(path.split('/')[-1])
@@ -184,9 +853,21 @@ class APIHandler(BaseHTTPRequestHandler):
         elif path == '/matched-documents':
             self.get_matched_documents(query_params)
             
+        elif path.startswith('/jobs/'):
+            job_id = path.split('/')[-1]
+            self.get_job(job_id)
+            
+        elif path == '/cache/stats':
+            self._send_json_response(200, response_cache.stats())
+            
+        elif path == '/metrics':
+            self.send_metrics()
+            
+        elif path == '/debug/slow-queries':
+            self.get_slow_queries(query_params)
+            
         else:
-            self.send_response(404)
-            self.end_headers()
+            self._send_json_response(404, {"error": "Endpoint not found"})
     
     def do_PUT(self):
         """Handle PUT requests"""
@@ -207,11 +888,7 @@ class APIHandler(BaseHTTPRequestHandler):
             persona_id = int(path.split('/')[-1])
             self.update_persona(persona_id, data)
         else:
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Endpoint not found"}).encode())
+            self._send_json_response(404, {"error": "Endpoint not found"})
     
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
@@ -220,6 +897,7 @@ class APIHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.send_header('Access-Control-Max-Age', '86400')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_POST(self):
@@ -228,11 +906,32 @@ class APIHandler(BaseHTTPRequestHandler):
         path = parsed_path.path
         query_params = parse_qs(parsed_path.query)
         
+        upload = path in ('/documents/bulk', '/api/upload')
+        run_async = upload and query_params.get('async', ['false'])[0].lower() in ('1', 'true')
+        
+        # NDJSON uploads are parsed and stored as they arrive instead of being read whole
+        if upload and NDJSON_CONTENT_TYPE in self.headers.get('Content-Type', ''):
+            if run_async:
+                self.queue_ndjson_ingest_job(path)
+            else:
+                self.ingest_ndjson_documents()
+            return
+        
         # Handle requests without Content-Length header
         content_length = self.headers.get('Content-Length')
         if content_length:
             content_length = int(content_length)
             post_data = self.rfile.read(content_length)
+            if self.headers.get('Content-Encoding'):
+                try:
+                    post_data = b''.join(decode_body(iter([post_data]), self.headers.get('Content-Encoding')))
+                except UnsupportedEncoding as e:
+                    self._send_json_response(415, {"error": str(e)})
+                    return
+                except (ValueError, EOFError, zlib.error) as e:
+                    self.close_connection = True
+                    self._send_json_response(400, {"error": f"Malformed request body: {e}"})
+                    return
             # Special case for clear-embeddings endpoint that doesn't need JSON data
             if path == '/documents/clear-embeddings':
                 data = {}
@@ -241,7 +940,10 @@ class APIHandler(BaseHTTPRequestHandler):
         else:
             data = {}
         
-        if path == '/personas':
+        if run_async:
+            self.queue_ingest_job(path, data)
+            
+        elif path == '/personas':
             self.create_persona(data)
             
         elif path == '/comments':
@@ -269,200 +971,447 @@ class APIHandler(BaseHTTPRequestHandler):
         elif path == '/documents/chunk-embeddings':
             self.update_document_chunk_embeddings(data)
             
+        elif path == '/documents/embeddings/batch':
+            self.update_document_embeddings_batch(data)
+            
         elif path == '/matched-documents':
             self.save_matched_documents(data)
             
         else:
-            self.send_response(404)
-            self.end_headers()
+            self._send_json_response(404, {"error": "Endpoint not found"})
+    
+    def _send_json_response(self, status_code, data, headers=None, cache=None):
+        """
+        Send a compact JSON response, compressed when the client accepts it and the body is large enough.
+        cache=(key, generation, tags) also stores a 200 response in response_cache.
+        """
+        with phase_timer('serialize'):
+            body = dumps_compact(data)
+        encoding = None
+        if len(body) >= COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+            with phase_timer('compress'):
+                body = compress_body(body, encoding)
+        if cache and status_code == 200:
+            key, generation, tags = cache
+            cached_headers = dict(headers or {})
+            etag = cached_headers.pop('ETag', None)
+            response_cache.put(key, CachedResponse(body, encoding, cached_headers, set(tags), etag), generation)
+        self._send_body(status_code, body, encoding, headers)
+    
+    def _send_body(self, status_code, body, encoding, headers):
+        """Write an already serialized (and possibly compressed) JSON body"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'X-Next-Cursor, ETag')
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _response_cache_key(self):
+        """Route, params and negotiated encoding identify a cached response"""
+        parsed = urlparse(self.path)
+        params = tuple(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+        return (parsed.path, params, choose_encoding(self.headers.get('Accept-Encoding')))
+    
+    def _send_cached_response(self, key, etag=None):
+        """
+        Serve key from response_cache; returns True when the response was sent.
+        With etag, an entry built under a different ETag counts as a miss.
+        """
+        entry = response_cache.get(key)
+        if entry is None or entry.etag != etag:
+            return False
+        headers = dict(entry.headers)
+        if etag:
+            headers['ETag'] = etag
+        self._send_body(200, entry.body, entry.encoding, headers)
+        return True
+    
+    def _not_modified(self, etag):
+        """Answer 304 if If-None-Match already holds etag; returns True when the response was sent"""
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        # Weak comparison (RFC 9110 13.1.2): the W/ prefix is ignored
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if '*' not in candidates and etag.removeprefix('W/') not in candidates:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'X-Next-Cursor, ETag')
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        self.end_headers()
+        return True
+    
+    def _wants_ndjson(self, query_params):
+        """True if the client asked for a streamed NDJSON response"""
+        return (query_params.get('format', [None])[0] == 'ndjson'
+                or NDJSON_CONTENT_TYPE in self.headers.get('Accept', ''))
+    
+    def _send_ndjson_stream(self, cursor, row_to_dict, headers=None):
+        """
+        Stream cursor rows as newline-delimited JSON using chunked transfer encoding.
+        HTTP/1.0 clients cannot parse chunks, so they get the raw stream ended by closing the connection.
+        """
+        chunked = self.request_version != 'HTTP/1.0'
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        compressor = StreamCompressor(encoding)
+        self.send_response(200)
+        self.send_header('Content-type', NDJSON_CONTENT_TYPE)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        
+        def write(data):
+            self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data) if chunked else data)
+        
+        try:
+            while True:
+                rows = cursor.fetchmany(NDJSON_BATCH_SIZE)
+                if not rows:
+                    break
+                with phase_timer('serialize'):
+                    chunk = b''.join(dumps_compact(row_to_dict(row)) + b'\n' for row in rows)
+                with phase_timer('compress'):
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    write(chunk)
+            tail = compressor.finish()
+            if tail:
+                write(tail)
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except Exception:
+            # The status line is already out, so the only way to signal failure is to drop the connection
+            self.close_connection = True
+            raise
     
     def get_documents(self, query_params):
         """Get all documents"""
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        try:
+            fields = select_document_fields(query_params)
+        except ValueError as e:
+            self._send_json_response(400, {"error": str(e)})
+            return
         
         limit = int(query_params.get('limit', [10])[0])
         offset = int(query_params.get('offset', [0])[0])
+        cursor_token = query_params.get('cursor', [None])[0]
         
-        cursor.execute("""
-            SELECT id, document_id, title, text, agency_id, 
-                   document_type, web_comment_link, web_document_link, web_docket_link,
-                   docket_id, embedding, chunk_embeddings, posted_date, comment_end_date
-            FROM documents
-            ORDER BY posted_date DESC
-            LIMIT ? OFFSET ?
-        """, (limit, offset))
+        try:
+            position = decode_cursor(cursor_token, 2) if cursor_token else None
+        except ValueError as e:
+            self._send_json_response(400, {"error": str(e)})
+            return
         
-        results = []
-        for row in cursor.fetchall():
-            # Parse embedding JSON if it exists
-            embedding = None
-            if row[10]:  # embedding field
-                try:
-                    embedding = json.loads(row[10])
-                except (json.JSONDecodeError, TypeError):
-                    embedding = None
-            
-            # Parse chunk_embeddings JSON if it exists
-            chunk_embeddings = None
-            if row[11]:  # chunk_embeddings field
-                try:
-                    chunk_embeddings = json.loads(row[11])
-                except (json.JSONDecodeError, TypeError):
-                    chunk_embeddings = None
-            
-            results.append({
-                'id': row[0],
-                'document_id': row[1],
-                'title': row[2],
-                'text': row[3],
-                'agency_id': row[4],
-                'document_type': row[5],
-                'web_comment_link': row[6],
-                'web_document_link': row[7],
-                'web_docket_link': row[8],
-                'docket_id': row[9],
-                'embedding': embedding,
-                'chunk_embeddings': chunk_embeddings,
-                'posted_date': row[12],
-                'comment_end_date': row[13]
-            })
+        # Generation first: a write committing after it either shows in the ETag or keeps the response out of the cache
+        generation = response_cache.generation()
+        stream = self._wants_ndjson(query_params)
+        etag = table_versions_etag('documents', variant='-ndjson' if stream else '')
+        if self._not_modified(etag):
+            return
         
-        conn.close()
+        cache_key = self._response_cache_key()
+        if not stream and self._send_cached_response(cache_key, etag):
+            return
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(results).encode())
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        if position:
+            cursor.execute(documents_page_sql(fields, keyset=True), (position[0], position[1], limit))
+        else:
+            cursor.execute(documents_page_sql(fields), (limit, offset))
+        
+        if stream:
+            try:
+                self._send_ndjson_stream(cursor, lambda row: document_row_to_dict(fields, row), {'ETag': etag})
+            finally:
+                release_db_connection(conn)
+            return
+        
+        rows = cursor.fetchall()
+        results = [document_row_to_dict(fields, row) for row in rows]
+        
+        release_db_connection(conn)
+        
+        headers = {'ETag': etag}
+        if rows and len(rows) == limit:
+            headers['X-Next-Cursor'] = encode_cursor(rows[-1][-2:])
+        
+        self._send_json_response(200, results, headers, cache=(cache_key, generation, ['documents']))
     
-    def get_document(self, document_id):
+    def get_document(self, document_id, query_params):
         """Get specific document"""
-        conn = sqlite3.connect(DB_FILE)
+        try:
+            fields = select_document_fields(query_params)
+        except ValueError as e:
+            self._send_json_response(400, {"error": str(e)})
+            return
+        
+        cache_key = self._response_cache_key()
+        if self._send_cached_response(cache_key):
+            return
+        generation = response_cache.generation()
+        
+        conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT id, document_id, title, text, agency_id, 
-                   document_type, web_comment_link, web_document_link, web_docket_link,
-                   docket_id, embedding, chunk_embeddings, posted_date, comment_end_date
+        cursor.execute(f"""
+            SELECT {', '.join(fields)}
             FROM documents WHERE document_id = ?
         """, (document_id,))
         
         row = cursor.fetchone()
-        conn.close()
+        release_db_connection(conn)
         
         if row:
-            # Parse embedding JSON if it exists
-            embedding = None
-            if row[10]:  # embedding field
-                try:
-                    embedding = json.loads(row[10])
-                except (json.JSONDecodeError, TypeError):
-                    embedding = None
-            
-            # Parse chunk_embeddings JSON if it exists
-            chunk_embeddings = None
-            if row[11]:  # chunk_embeddings field
-                try:
-                    chunk_embeddings = json.loads(row[11])
-                except (json.JSONDecodeError, TypeError):
-                    chunk_embeddings = None
-            
-            result = {
-                'id': row[0],
-                'document_id': row[1],
-                'title': row[2],
-                'text': row[3],
-                'agency_id': row[4],
-                'document_type': row[5],
-                'web_comment_link': row[6],
-                'web_document_link': row[7],
-                'web_docket_link': row[8],
-                'docket_id': row[9],
-                'embedding': embedding,
-                'chunk_embeddings': chunk_embeddings,
-                'posted_date': row[12],
-                'comment_end_date': row[13]
-            }
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, document_row_to_dict(fields, row),
+                                     cache=(cache_key, generation, [f"document:{document_id}"]))
         else:
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+            self._send_json_response(404, {"error": "Document not found"})
     
     def search_documents(self, query_params):
-        """Search documents"""
+        """Search documents (BM25-ranked full-text search with highlighted snippets)"""
         query = query_params.get('q', [''])[0]
         limit = int(query_params.get('limit', [10])[0])
+        fts_query = build_fts_query(query)
         
-        conn = sqlite3.connect(DB_FILE)
+        try:
+            fields = select_document_fields(query_params)
+        except ValueError as e:
+            self._send_json_response(400, {"error": str(e)})
+            return
+        
+        conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT id, document_id, title, text, agency_id, 
-                   document_type, web_comment_link, web_document_link, web_docket_link,
-                   docket_id, embedding, chunk_embeddings, posted_date, comment_end_date
-            FROM documents
-            WHERE title LIKE ? OR text LIKE ?
-            ORDER BY posted_date DESC
-            LIMIT ?
-        """, (f'%{query}%', f'%{query}%', limit))
+        if FTS_ENABLED and fts_query:
+            # bm25() is lower-is-better; titles weigh 10x body text
+            cursor.execute(f"""
+                SELECT {', '.join('d.' + field for field in fields)},
+                       bm25(documents_fts, {FTS_TITLE_WEIGHT}, 1.0) AS rank,
+                       snippet(documents_fts, -1, '<mark>', '</mark>', '…', {FTS_SNIPPET_TOKENS})
+                FROM documents_fts
+                JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            """, (fts_query, limit))
+        else:
+            cursor.execute(f"""
+                SELECT {', '.join(fields)}, NULL, NULL
+                FROM documents
+                WHERE title LIKE ? OR text LIKE ?
+                ORDER BY posted_date DESC
+                LIMIT ?
+            """, (f'%{query}%', f'%{query}%', limit))
         
         results = []
         for row in cursor.fetchall():
-            # Parse embedding JSON if it exists
-            embedding = None
-            if row[10]:  # embedding field
-                try:
-                    embedding = json.loads(row[10])
-                except (json.JSONDecodeError, TypeError):
-                    embedding = None
-            
-            # Parse chunk_embeddings JSON if it exists
-            chunk_embeddings = None
-            if row[11]:  # chunk_embeddings field
-                try:
-                    chunk_embeddings = json.loads(row[11])
-                except (json.JSONDecodeError, TypeError):
-                    chunk_embeddings = None
-            
-            results.append({
-                'id': row[0],
-                'document_id': row[1],
-                'title': row[2],
-                'text': row[3],
-                'agency_id': row[4],
-                'document_type': row[5],
-                'web_comment_link': row[6],
-                'web_document_link': row[7],
-                'web_docket_link': row[8],
-                'docket_id': row[9],
-                'embedding': embedding,
-                'chunk_embeddings': chunk_embeddings,
-                'posted_date': row[12],
-                'comment_end_date': row[13]
-            })
+            result = document_row_to_dict(fields, row)
+            result['score'] = -row[-2] if row[-2] is not None else None
+            result['snippet'] = row[-1]
+            results.append(result)
         
-        conn.close()
+        release_db_connection(conn)
         
         response = {"query": query, "results": results}
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
+        self._send_json_response(200, response)
+    
+    def get_similar_documents(self, query_params):
+        """Rank documents by cosine similarity to a persona's embedding"""
+        persona_id = query_params.get('persona_id', [None])[0]
+        k = int(query_params.get('k', [10])[0])
+        mode = query_params.get('mode', ['ann'])[0]
+        scoring = query_params.get('scoring', [None])[0]
+        try:
+            top_n = int(query_params.get('top_n', [3])[0])
+        except ValueError:
+            top_n = 0
+        if top_n < 1:
+            self._send_json_response(400, {"error": "top_n must be a positive integer"})
+            return
+        try:
+            nprobe = int(query_params.get('nprobe', [ANN_NPROBE])[0])
+        except ValueError:
+            nprobe = 0
+        if nprobe < 1:
+            self._send_json_response(400, {"error": "nprobe must be a positive integer"})
+            return
+        
+        if scoring and scoring not in ChunkEmbeddingMatrix.SCORING_MODES:
+            self._send_json_response(400, {"error": f"scoring must be one of {', '.join(ChunkEmbeddingMatrix.SCORING_MODES)}"})
+            return
+        
+        if not persona_id:
+            self._send_json_response(400, {"error": "persona_id is required"})
+            return
+        
+        if not numpy_available():
+            self._send_json_response(503, {"error": "Similarity search requires numpy to be installed"})
+            return
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT embedding FROM personas WHERE id = ?", (persona_id,))
+        row = cursor.fetchone()
+        release_db_connection(conn)
+        
+        if not row:
+            self._send_json_response(404, {"error": "Persona not found"})
+            return
+        
+        persona_embedding = unpack_embedding(row[0])
+        if not persona_embedding:
+            self._send_json_response(400, {"error": "Persona has no embedding"})
+            return
+        
+        if scoring:
+            # Chunk-level scoring always scans every chunk exactly
+            mode = scoring
+            matches = chunk_embeddings_matrix.search(persona_embedding, k, scoring=scoring, top_n=top_n)
+        elif mode == 'exact':
+            matches = document_embeddings.search(persona_embedding, k)
+        else:
+            mode = 'ann'
+            matches = ann_index.search(persona_embedding, k, nprobe)
+        
+        result = {
+            'persona_id': int(persona_id),
+            'k': k,
+            'mode': mode,
+            'results': [{'document_id': document_id, 'score': score} for document_id, score in matches]
+        }
+        
+        self._send_json_response(200, result)
+    
+    def hybrid_search_documents(self, query_params):
+        """Fuse full-text and persona-embedding rankings with reciprocal rank fusion"""
+        query = query_params.get('q', [''])[0]
+        persona_id = query_params.get('persona_id', [None])[0]
+        k = int(query_params.get('k', [10])[0])
+        candidates = max(k, HYBRID_CANDIDATES)
+        fts_query = build_fts_query(query)
+        filters = build_document_filters(query_params)
+        try:
+            nprobe = int(query_params.get('nprobe', [ANN_NPROBE])[0])
+        except ValueError:
+            nprobe = 0
+        if nprobe < 1:
+            self._send_json_response(400, {"error": "nprobe must be a positive integer"})
+            return
+        
+        if not fts_query and not persona_id:
+            self._send_json_response(400, {"error": "q or persona_id is required"})
+            return
+        
+        persona_embedding = None
+        if persona_id:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT embedding FROM personas WHERE id = ?", (persona_id,))
+            row = cursor.fetchone()
+            release_db_connection(conn)
+            if not row:
+                self._send_json_response(404, {"error": "Persona not found"})
+                return
+            persona_embedding = unpack_embedding(row[0])
+        
+        # Run both retrievers in parallel
+        lexical_future = None
+        vector_future = None
+        if fts_query and FTS_ENABLED:
+            lexical_future = hybrid_executor.submit(lexical_candidates, fts_query, filters, candidates)
+        if persona_embedding and numpy_available():
+            vector_future = hybrid_executor.submit(vector_candidates, persona_embedding, filters, candidates, nprobe)
+        lexical = lexical_future.result() if lexical_future else []
+        vector = vector_future.result() if vector_future else []
+        
+        fused = {}
+        for rank, (document_id, snippet) in enumerate(lexical, start=1):
+            entry = fused.setdefault(document_id, {'score': 0.0})
+            entry['score'] += 1.0 / (RRF_K + rank)
+            entry['lexical_rank'] = rank
+            entry['snippet'] = snippet
+        for rank, (document_id, similarity) in enumerate(vector, start=1):
+            entry = fused.setdefault(document_id, {'score': 0.0})
+            entry['score'] += 1.0 / (RRF_K + rank)
+            entry['vector_rank'] = rank
+            entry['similarity_score'] = similarity
+        
+        top = sorted(fused.items(), key=lambda item: item[1]['score'], reverse=True)[:k]
+        
+        # Fetch display fields for the winners only (no text or embeddings)
+        documents = {}
+        if top:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            placeholders = ','.join('?' * len(top))
+            cursor.execute(f"""
+                SELECT id, document_id, title, agency_id, document_type, web_comment_link,
+                       web_document_link, web_docket_link, docket_id, posted_date, comment_end_date
+                FROM documents WHERE document_id IN ({placeholders})
+            """, [document_id for document_id, _ in top])
+            for row in cursor.fetchall():
+                documents[row[1]] = {
+                    'id': row[0],
+                    'document_id': row[1],
+                    'title': row[2],
+                    'agency_id': row[3],
+                    'document_type': row[4],
+                    'web_comment_link': row[5],
+                    'web_document_link': row[6],
+                    'web_docket_link': row[7],
+                    'docket_id': row[8],
+                    'posted_date': row[9],
+                    'comment_end_date': row[10]
+                }
+            release_db_connection(conn)
+        
+        results = []
+        for document_id, entry in top:
+            if document_id not in documents:
+                continue
+            results.append({
+                **documents[document_id],
+                'score': entry['score'],
+                'lexical_rank': entry.get('lexical_rank'),
+                'vector_rank': entry.get('vector_rank'),
+                'similarity_score': entry.get('similarity_score'),
+                'snippet': entry.get('snippet')
+            })
+        
+        response = {
+            "query": query,
+            "persona_id": int(persona_id) if persona_id else None,
+            "k": k,
+            "results": results
+        }
+        
+        self._send_json_response(200, response)
     
     def create_persona(self, data):
         """Create a new persona"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -480,12 +1429,14 @@ class APIHandler(BaseHTTPRequestHandler):
             json.dumps(data.get('preferred_agencies', [])),
             json.dumps(data.get('impact_level', [])),
             data.get('additional_context'),
-            json.dumps(data.get('embedding', [])) if data.get('embedding') else None
+            pack_embedding(data.get('embedding'), data.get('embedding_model'))
         ))
         
         persona_id = cursor.lastrowid
+        bump_table_versions(cursor, 'personas')
         conn.commit()
-        conn.close()
+        release_db_connection(conn)
+        response_cache.invalidate(['personas'])
         
         result = {
             'id': persona_id,
@@ -503,15 +1454,11 @@ class APIHandler(BaseHTTPRequestHandler):
             'updated_at': datetime.now().isoformat()
         }
         
-        self.send_response(201)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self._send_json_response(201, result)
     
     def update_persona(self, persona_id, data):
         """Update an existing persona"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -531,13 +1478,15 @@ class APIHandler(BaseHTTPRequestHandler):
             json.dumps(data.get('preferred_agencies', [])),
             json.dumps(data.get('impact_level', [])),
             data.get('additional_context'),
-            json.dumps(data.get('embedding', [])) if data.get('embedding') else None,
+            pack_embedding(data.get('embedding'), data.get('embedding_model')),
             persona_id
         ))
         
         if cursor.rowcount > 0:
+            bump_table_versions(cursor, 'personas')
             conn.commit()
-            conn.close()
+            release_db_connection(conn)
+            response_cache.invalidate(['personas', f"persona:{persona_id}"])
             
             result = {
                 'id': persona_id,
@@ -554,22 +1503,24 @@ class APIHandler(BaseHTTPRequestHandler):
                 'updated_at': datetime.now().isoformat()
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, result)
         else:
-            conn.close()
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Persona not found"}).encode())
-    
-    def get_all_personas(self):
+            release_db_connection(conn)
+            self._send_json_response(404, {"error": "Persona not found"})
+    
+    def get_all_personas(self, query_params):
         """Get all personas"""
-        conn = sqlite3.connect(DB_FILE)
+        generation = response_cache.generation()
+        stream = self._wants_ndjson(query_params)
+        etag = table_versions_etag('personas', variant='-ndjson' if stream else '')
+        if self._not_modified(etag):
+            return
+        
+        cache_key = self._response_cache_key()
+        if not stream and self._send_cached_response(cache_key, etag):
+            return
+        
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -580,44 +1531,27 @@ class APIHandler(BaseHTTPRequestHandler):
             ORDER BY created_at DESC
         """)
         
-        results = []
-        for row in cursor.fetchall():
-            # Parse embedding JSON if it exists
-            embedding = None
-            if row[11]:  # embedding field
-                try:
-                    embedding = json.loads(row[11])
-                except (json.JSONDecodeError, TypeError):
-                    embedding = None
-            
-            results.append({
-                'id': row[0],
-                'name': row[1],
-                'role': row[2],
-                'location': row[3],
-                'age_range': row[4],
-                'employment_status': row[5],
-                'industry': row[6],
-                'policy_interests': json.loads(row[7]) if row[7] else [],
-                'preferred_agencies': json.loads(row[8]) if row[8] else [],
-                'impact_level': json.loads(row[9]) if row[9] else [],
-                'additional_context': row[10],
-                'embedding': embedding,
-                'created_at': row[12],
-                'updated_at': row[13]
-            })
+        if stream:
+            try:
+                self._send_ndjson_stream(cursor, persona_row_to_dict, {'ETag': etag})
+            finally:
+                release_db_connection(conn)
+            return
         
-        conn.close()
+        results = [persona_row_to_dict(row) for row in cursor.fetchall()]
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(results).encode())
+        release_db_connection(conn)
+        
+        self._send_json_response(200, results, {'ETag': etag}, cache=(cache_key, generation, ['personas']))
     
     def get_persona(self, persona_id):
         """Get persona by ID"""
-        conn = sqlite3.connect(DB_FILE)
+        cache_key = self._response_cache_key()
+        if self._send_cached_response(cache_key):
+            return
+        generation = response_cache.generation()
+        
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -628,49 +1562,18 @@ class APIHandler(BaseHTTPRequestHandler):
         """, (persona_id,))
         
         row = cursor.fetchone()
-        conn.close()
+        release_db_connection(conn)
         
         if row:
-            # Parse embedding JSON if it exists
-            embedding = None
-            if row[11]:  # embedding field
-                try:
-                    embedding = json.loads(row[11])
-                except (json.JSONDecodeError, TypeError):
-                    embedding = None
+            result = persona_row_to_dict(row)
             
-            result = {
-                'id': row[0],
-                'name': row[1],
-                'role': row[2],
-                'location': row[3],
-                'age_range': row[4],
-                'employment_status': row[5],
-                'industry': row[6],
-                'policy_interests': json.loads(row[7]) if row[7] else [],
-                'preferred_agencies': json.loads(row[8]) if row[8] else [],
-                'impact_level': json.loads(row[9]) if row[9] else [],
-                'additional_context': row[10],
-                'embedding': embedding,
-                'created_at': row[12],
-                'updated_at': row[13]
-            }
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, result, cache=(cache_key, generation, [f"persona:{persona_id}"]))
         else:
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Persona not found"}).encode())
+            self._send_json_response(404, {"error": "Persona not found"})
     
     def create_comment(self, persona_id, data):
         """Create a new comment"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -680,7 +1583,7 @@ class APIHandler(BaseHTTPRequestHandler):
         
         comment_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        release_db_connection(conn)
         
         result = {
             'id': comment_id,
@@ -692,15 +1595,11 @@ class APIHandler(BaseHTTPRequestHandler):
             'created_at': datetime.now().isoformat()
         }
         
-        self.send_response(201)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self._send_json_response(201, result)
     
     def get_comment(self, comment_id):
         """Get comment by ID"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -709,7 +1608,7 @@ class APIHandler(BaseHTTPRequestHandler):
         """, (comment_id,))
         
         row = cursor.fetchone()
-        conn.close()
+        release_db_connection(conn)
         
         if row:
             result = {
@@ -722,99 +1621,170 @@ class APIHandler(BaseHTTPRequestHandler):
                 'created_at': row[6]
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, result)
         else:
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Comment not found"}).encode())
+            self._send_json_response(404, {"error": "Comment not found"})
     
     def bulk_insert_documents(self, data):
         """Bulk insert documents from API data"""
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        conn = get_db_connection()
         
         documents = data.get('documents', [])
+        inserted_count, updated_count, errors, indexed_embeddings = upsert_documents(conn, documents)
+        
+        release_db_connection(conn)
+        on_document_embeddings_written(indexed_embeddings)
+        
+        result = {
+            'success': True,
+            'inserted': inserted_count,
+            'updated': updated_count,
+            'total_processed': len(documents),
+            'errors': errors,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        self._send_json_response(200, result)
+    
+    def ingest_ndjson_documents(self):
+        """
+        Store an NDJSON upload (one document per line, optionally gzip/zstd encoded) while it
+        is being received. Memory is bounded by one UPSERT_BATCH_SIZE batch; each batch is
+        committed as soon as it is full.
+        """
+        pieces = decode_body(iter_body(self.rfile, self.headers), self.headers.get('Content-Encoding'))
+        conn = get_db_connection()
+        
         inserted_count = 0
         updated_count = 0
+        total_processed = 0
+        error_count = 0
         errors = []
+        batch = []
+        
+        def record_error(message):
+            nonlocal error_count
+            error_count += 1
+            if len(errors) < NDJSON_MAX_REPORTED_ERRORS:
+                errors.append(message)
+        
+        def flush_batch():
+            nonlocal inserted_count, updated_count
+            inserted, updated, batch_errors, indexed_embeddings = upsert_documents(conn, batch)
+            inserted_count += inserted
+            updated_count += updated
+            for error in batch_errors:
+                record_error(error)
+            on_document_embeddings_written(indexed_embeddings, flush=False)
+            batch.clear()
+        
+        print("Streaming NDJSON document upload...")
+        
+        try:
+            for line_number, doc in iter_ndjson(pieces):
+                if not isinstance(doc, dict):
+                    record_error(f"Line {line_number}: expected a JSON object per line ({doc})")
+                    continue
+                batch.append(doc)
+                total_processed += 1
+                if len(batch) >= UPSERT_BATCH_SIZE:
+                    flush_batch()
+            flush_batch()
+        except UnsupportedEncoding as e:
+            release_db_connection(conn)
+            # The unread body is still on the socket
+            self.close_connection = True
+            self._send_json_response(415, {"error": str(e)})
+            return
+        except ValueError as e:
+            release_db_connection(conn)
+            on_document_embeddings_written([])
+            self.close_connection = True
+            self._send_json_response(400, {
+                "error": f"Malformed request body: {e}",
+                "inserted": inserted_count,
+                "updated": updated_count
+            })
+            return
         
-        for doc in documents:
-            try:
-                # Extract data from API format
-                document_id = doc.get('documentId') or doc.get('document_id', '')
-                title = doc.get('title', '')
-                text = doc.get('text', '')
-                agency_id = doc.get('agencyId') or doc.get('agency_id', '')
-                document_type = doc.get('documentType') or doc.get('document_type', '')
-                web_comment_link = doc.get('webCommentLink') or doc.get('web_comment_link', '')
-                web_document_link = doc.get('webDocumentLink') or doc.get('web_document_link', '')
-                web_docket_link = doc.get('webDocketLink') or doc.get('web_docket_link', '')
-                docket_id = doc.get('docketId') or doc.get('docket_id', '')
-                embedding = doc.get('embedding', [])
-                posted_date = doc.get('postedDate') or doc.get('posted_date', '')
-                comment_end_date = doc.get('commentEndDate') or doc.get('comment_end_date', '')
-                
-                # Convert embedding array to JSON string for storage
-                embedding_json = json.dumps(embedding) if embedding else None
-                
-                # Check if document already exists
-                cursor.execute("SELECT id FROM documents WHERE document_id = ?", (document_id,))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update existing document
-                    cursor.execute("""
-                        UPDATE documents 
-                        SET title = ?, text = ?, agency_id = ?, document_type = ?,
-                            web_comment_link = ?, web_document_link = ?, web_docket_link = ?,
-                            docket_id = ?, embedding = ?, posted_date = ?, comment_end_date = ?
-                        WHERE document_id = ?
-                    """, (title, text, agency_id, document_type, 
-                          web_comment_link, web_document_link, web_docket_link,
-                          docket_id, embedding_json, posted_date, comment_end_date, document_id))
-                    updated_count += 1
-                else:
-                    # Insert new document
-                    cursor.execute("""
-                        INSERT INTO documents (document_id, title, text, agency_id, 
-                                             document_type, web_comment_link, web_document_link, 
-                                             web_docket_link, docket_id, embedding, posted_date, comment_end_date)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (document_id, title, text, agency_id, document_type,
-                          web_comment_link, web_document_link, web_docket_link,
-                          docket_id, embedding_json, posted_date, comment_end_date))
-                    inserted_count += 1
-                    
-            except Exception as e:
-                errors.append(f"Error processing document {doc.get('documentId', 'unknown')}: {str(e)}")
-        
-        conn.commit()
-        conn.close()
+        release_db_connection(conn)
+        # Persist the ANN index once the whole upload is in
+        on_document_embeddings_written([])
         
         result = {
             'success': True,
             'inserted': inserted_count,
             'updated': updated_count,
-            'total_processed': len(documents),
+            'total_processed': total_processed,
             'errors': errors,
+            'error_count': error_count,
             'timestamp': datetime.now().isoformat()
         }
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        print(f"Upload complete: {inserted_count} inserted, {updated_count} updated, {error_count} errors")
+        
+        self._send_json_response(200, result)
+    
+    def queue_ingest_job(self, source, data):
+        """Hand a JSON upload to the background ingest queue and return its job id straight away"""
+        # Handle both direct documents array and nested data structure (as upload_api_data does)
+        documents = data.get('documents', [])
+        if not documents and 'data' in data and 'documents' in data['data']:
+            documents = data['data']['documents']
+        
+        job_id = ingest_jobs.submit_documents(source, documents)
+        self._send_job_accepted(job_id)
+    
+    def queue_ndjson_ingest_job(self, source):
+        """Spool an NDJSON upload to disk and ingest it in the background"""
+        pieces = decode_body(iter_body(self.rfile, self.headers), self.headers.get('Content-Encoding'))
+        try:
+            job_id = ingest_jobs.submit_ndjson(source, pieces)
+        except UnsupportedEncoding as e:
+            self.close_connection = True
+            self._send_json_response(415, {"error": str(e)})
+            return
+        except ValueError as e:
+            self.close_connection = True
+            self._send_json_response(400, {"error": f"Malformed request body: {e}"})
+            return
+        self._send_job_accepted(job_id)
+    
+    def _send_job_accepted(self, job_id):
+        self._send_json_response(202, {
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f"/jobs/{job_id}"
+        }, {'Location': f"/jobs/{job_id}"})
     
+    def get_job(self, job_id):
+        """Get progress of a background ingest job"""
+        job = ingest_jobs.get(job_id)
+        if job:
+            self._send_json_response(200, job)
+        else:
+            self._send_json_response(404, {"error": "Job not found"})
+
+    def get_slow_queries(self, query_params):
+        """Get the slowest SQLite statements seen since startup (or the last reset)"""
+        try:
+            limit = int(query_params.get('limit', [SLOW_QUERY_TOP_N])[0])
+        except ValueError:
+            self._send_json_response(400, {"error": "limit must be an integer"})
+            return
+        queries = slow_query_log.top(limit)
+        if query_params.get('reset', ['false'])[0].lower() == 'true':
+            slow_query_log.reset()
+        self._send_json_response(200, {
+            "threshold_ms": slow_query_log.threshold_ms,
+            "count": len(queries),
+            "queries": queries
+        })
+
     def clear_documents(self):
         """Clear all documents from the database"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Count documents before deletion
@@ -824,8 +1794,11 @@ class APIHandler(BaseHTTPRequestHandler):
         # Delete all documents
         cursor.execute("DELETE FROM documents")
         
+        bump_table_versions(cursor, 'documents')
         conn.commit()
-        conn.close()
+        release_db_connection(conn)
+        on_document_embeddings_cleared()
+        response_cache.clear()
         
         result = {
             'success': True,
@@ -833,15 +1806,11 @@ class APIHandler(BaseHTTPRequestHandler):
             'timestamp': datetime.now().isoformat()
         }
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self._send_json_response(200, result)
     
     def clear_document_embeddings(self):
         """Clear all document embeddings from the database"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Count documents with embeddings before clearing
@@ -851,8 +1820,11 @@ class APIHandler(BaseHTTPRequestHandler):
         # Clear all embeddings
         cursor.execute("UPDATE documents SET embedding = NULL, chunk_embeddings = NULL")
         
+        bump_table_versions(cursor, 'documents')
         conn.commit()
-        conn.close()
+        release_db_connection(conn)
+        on_document_embeddings_cleared()
+        response_cache.clear()
         
         result = {
             'success': True,
@@ -860,81 +1832,25 @@ class APIHandler(BaseHTTPRequestHandler):
             'timestamp': datetime.now().isoformat()
         }
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self._send_json_response(200, result)
     
     def upload_api_data(self, data):
         """Upload API data with embeddings to database"""
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        conn = get_db_connection()
         
         # Handle both direct documents array and nested data structure
         documents = data.get('documents', [])
         if not documents and 'data' in data and 'documents' in data['data']:
             documents = data['data']['documents']
         
-        inserted_count = 0
-        updated_count = 0
-        errors = []
-        
         print(f"Processing {len(documents)} documents for upload...")
         
-        for doc in documents:
-            try:
-                # Extract data from API format
-                document_id = doc.get('documentId') or doc.get('document_id', '')
-                title = doc.get('title', '')
-                text = doc.get('text', '')
-                agency_id = doc.get('agencyId') or doc.get('agency_id', '')
-                document_type = doc.get('documentType') or doc.get('document_type', '')
-                web_comment_link = doc.get('webCommentLink') or doc.get('web_comment_link', '')
-                web_document_link = doc.get('webDocumentLink') or doc.get('web_document_link', '')
-                web_docket_link = doc.get('webDocketLink') or doc.get('web_docket_link', '')
-                docket_id = doc.get('docketId') or doc.get('docket_id', '')
-                embedding = doc.get('embedding', [])
-                posted_date = doc.get('postedDate') or doc.get('posted_date', '')
-                comment_end_date = doc.get('commentEndDate') or doc.get('comment_end_date', '')
-                
-                # Convert embedding array to JSON string for storage
-                embedding_json = json.dumps(embedding) if embedding else None
-                
-                # Check if document already exists
-                cursor.execute("SELECT id FROM documents WHERE document_id = ?", (document_id,))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update existing document
-                    cursor.execute("""
-                        UPDATE documents 
-                        SET title = ?, text = ?, agency_id = ?, document_type = ?,
-                            web_comment_link = ?, web_document_link = ?, web_docket_link = ?,
-                            docket_id = ?, embedding = ?, posted_date = ?, comment_end_date = ?
-                        WHERE document_id = ?
-                    """, (title, text, agency_id, document_type, 
-                          web_comment_link, web_document_link, web_docket_link,
-                          docket_id, embedding_json, posted_date, comment_end_date, document_id))
-                    updated_count += 1
-                else:
-                    # Insert new document
-                    cursor.execute("""
-                        INSERT INTO documents (document_id, title, text, agency_id, 
-                                             document_type, web_comment_link, web_document_link, 
-                                             web_docket_link, docket_id, embedding, posted_date, comment_end_date)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (document_id, title, text, agency_id, document_type,
-                          web_comment_link, web_document_link, web_docket_link,
-                          docket_id, embedding_json, posted_date, comment_end_date))
-                    inserted_count += 1
-                    
-            except Exception as e:
-                errors.append(f"Error processing document {doc.get('documentId', 'unknown')}: {str(e)}")
-                print(f"Error processing document {doc.get('documentId', 'unknown')}: {str(e)}")
+        inserted_count, updated_count, errors, indexed_embeddings = upsert_documents(conn, documents)
+        for error in errors:
+            print(error)
         
-        conn.commit()
-        conn.close()
+        release_db_connection(conn)
+        on_document_embeddings_written(indexed_embeddings)
         
         result = {
             'success': True,
@@ -947,41 +1863,35 @@ class APIHandler(BaseHTTPRequestHandler):
         
         print(f"Upload complete: {inserted_count} inserted, {updated_count} updated, {len(errors)} errors")
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self._send_json_response(200, result)
     
     def update_persona_embedding(self, data):
         """Update persona embedding"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         persona_id = data.get('persona_id')
         embedding = data.get('embedding', [])
         
         if not persona_id:
-            conn.close()
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "persona_id is required"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(400, {"error": "persona_id is required"})
             return
         
-        # Convert embedding array to JSON string for storage
-        embedding_json = json.dumps(embedding) if embedding else None
+        # Pack embedding array as a float32 BLOB for storage
+        embedding_blob = pack_embedding(embedding, data.get('embedding_model'))
         
         cursor.execute("""
             UPDATE personas 
             SET embedding = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
-        """, (embedding_json, persona_id))
+        """, (embedding_blob, persona_id))
         
         if cursor.rowcount > 0:
+            bump_table_versions(cursor, 'personas')
             conn.commit()
-            conn.close()
+            release_db_connection(conn)
+            response_cache.invalidate(['personas', f"persona:{persona_id}"])
             
             result = {
                 'success': True,
@@ -990,48 +1900,39 @@ class APIHandler(BaseHTTPRequestHandler):
                 'updated_at': datetime.now().isoformat()
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, result)
         else:
-            conn.close()
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Persona not found"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(404, {"error": "Persona not found"})
     
     def update_document_embedding(self, data):
         """Update document embedding"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         document_id = data.get('document_id')
         embedding = data.get('embedding', [])
         
         if not document_id:
-            conn.close()
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "document_id is required"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(400, {"error": "document_id is required"})
             return
         
-        # Convert embedding array to JSON string for storage
-        embedding_json = json.dumps(embedding) if embedding else None
+        # Pack embedding array as a float32 BLOB for storage
+        embedding_blob = pack_embedding(embedding, data.get('embedding_model'))
         
         cursor.execute("""
             UPDATE documents 
             SET embedding = ?, created_at = CURRENT_TIMESTAMP
             WHERE document_id = ?
-        """, (embedding_json, document_id))
+        """, (embedding_blob, document_id))
         
         if cursor.rowcount > 0:
+            bump_table_versions(cursor, 'documents')
             conn.commit()
-            conn.close()
+            release_db_connection(conn)
+            on_document_embeddings_written([(document_id, embedding)], flush=False)
+            invalidate_document_responses([document_id])
             
             result = {
                 'success': True,
@@ -1040,48 +1941,44 @@ class APIHandler(BaseHTTPRequestHandler):
                 'updated_at': datetime.now().isoformat()
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, result)
         else:
-            conn.close()
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(404, {"error": "Document not found"})
     
     def update_document_chunk_embeddings(self, data):
         """Update document chunk embeddings"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         document_id = data.get('document_id')
         chunk_embeddings = data.get('chunk_embeddings', [])
         
         if not document_id:
-            conn.close()
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "document_id is required"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(400, {"error": "document_id is required"})
             return
         
-        # Convert chunk embeddings array to JSON string for storage
-        chunk_embeddings_json = json.dumps(chunk_embeddings) if chunk_embeddings else None
+        # Pack chunk embeddings as a single float32 matrix BLOB for storage
+        try:
+            chunk_embeddings_blob = pack_chunk_embeddings(chunk_embeddings, data.get('embedding_model'))
+        except ValueError as e:
+            release_db_connection(conn)
+            self._send_json_response(400, {"error": str(e)})
+            return
         
         cursor.execute("""
             UPDATE documents 
             SET chunk_embeddings = ?, created_at = CURRENT_TIMESTAMP
             WHERE document_id = ?
-        """, (chunk_embeddings_json, document_id))
+        """, (chunk_embeddings_blob, document_id))
         
         if cursor.rowcount > 0:
+            bump_table_versions(cursor, 'documents')
             conn.commit()
-            conn.close()
+            release_db_connection(conn)
+            chunk_embeddings_matrix.invalidate()
+            invalidate_document_responses([document_id])
             
             result = {
                 'success': True,
@@ -1090,34 +1987,127 @@ class APIHandler(BaseHTTPRequestHandler):
                 'updated_at': datetime.now().isoformat()
             }
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self._send_json_response(200, result)
         else:
-            conn.close()
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(404, {"error": "Document not found"})
+    
+    def update_document_embeddings_batch(self, data):
+        """
+        Update embeddings and/or chunk embeddings for many documents in one transaction.
+        Each item takes JSON arrays (embedding, chunk_embeddings) or base64 little-endian float32
+        (embedding_b64, chunk_embeddings_b64 with chunk_dimensions).
+        """
+        items = data.get('items', [])
+        default_model = data.get('embedding_model')
+        
+        if not isinstance(items, list) or not items:
+            self._send_json_response(400, {"error": "items must be a non-empty list"})
+            return
+        
+        embedding_updates = []
+        chunk_updates = []
+        indexed_embeddings = []
+        errors = []
+        
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append(f"Item {index}: expected an object, got {type(item).__name__}")
+                continue
+            document_id = item.get('document_id')
+            if not document_id:
+                errors.append("document_id is required")
+                continue
+            model = item.get('embedding_model', default_model)
+            try:
+                if 'embedding_b64' in item:
+                    embedding = floats_from_base64(item['embedding_b64'])
+                else:
+                    embedding = item.get('embedding')
+                
+                if 'chunk_embeddings_b64' in item:
+                    values = floats_from_base64(item['chunk_embeddings_b64'])
+                    dim = int(item.get('chunk_dimensions') or 0)
+                    if dim <= 0 or len(values) % dim:
+                        raise ValueError("chunk_dimensions must divide the binary chunk embedding length")
+                    chunk_embeddings = [values[i:i + dim] for i in range(0, len(values), dim)]
+                else:
+                    chunk_embeddings = item.get('chunk_embeddings')
+                
+                # Pack both before queueing either, so a bad item is skipped as a whole
+                embedding_blob = pack_embedding(embedding, model) if embedding is not None else None
+                chunk_embeddings_blob = (pack_chunk_embeddings(chunk_embeddings, model)
+                                         if chunk_embeddings is not None else None)
+            except (ValueError, TypeError) as e:
+                errors.append(f"Error processing embeddings for {document_id}: {str(e)}")
+                continue
+            
+            if embedding is not None:
+                embedding_updates.append((embedding_blob, document_id))
+                indexed_embeddings.append((document_id, embedding))
+            if chunk_embeddings is not None:
+                chunk_updates.append((chunk_embeddings_blob, document_id))
+        
+        requested_ids = list({document_id for _, document_id in embedding_updates + chunk_updates})
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Unknown ids are reported rather than failing the batch
+        existing = set()
+        for start in range(0, len(requested_ids), UPSERT_BATCH_SIZE):
+            chunk = requested_ids[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(f"""
+                SELECT document_id FROM documents
+                WHERE document_id IN ({', '.join('?' * len(chunk))})
+            """, chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        not_found = sorted(set(requested_ids) - existing)
+        
+        cursor.executemany("""
+            UPDATE documents 
+            SET embedding = ?, created_at = CURRENT_TIMESTAMP
+            WHERE document_id = ?
+        """, embedding_updates)
+        cursor.executemany("""
+            UPDATE documents 
+            SET chunk_embeddings = ?, created_at = CURRENT_TIMESTAMP
+            WHERE document_id = ?
+        """, chunk_updates)
+        
+        if existing:
+            bump_table_versions(cursor, 'documents')
+        conn.commit()
+        release_db_connection(conn)
+        
+        on_document_embeddings_written([item for item in indexed_embeddings if item[0] in existing])
+        invalidate_document_responses(existing)
+        if chunk_updates:
+            chunk_embeddings_matrix.invalidate()
+        
+        result = {
+            'success': True,
+            'updated': len(existing),
+            'embeddings_written': sum(1 for _, document_id in embedding_updates if document_id in existing),
+            'chunk_embeddings_written': sum(1 for _, document_id in chunk_updates if document_id in existing),
+            'not_found': not_found,
+            'errors': errors,
+            'updated_at': datetime.now().isoformat()
+        }
+        
+        self._send_json_response(200, result)
     
     def save_matched_documents(self, data):
         """Save matched documents that passed semantic and GPT thresholds"""
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         persona_id = data.get('persona_id')
         matched_documents = data.get('matched_documents', [])
         
         if not persona_id:
-            conn.close()
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "persona_id is required"}).encode())
+            release_db_connection(conn)
+            self._send_json_response(400, {"error": "persona_id is required"})
             return
         
         # Clear existing matches for this persona
@@ -1146,8 +2136,10 @@ class APIHandler(BaseHTTPRequestHandler):
             except Exception as e:
                 errors.append(f"Error saving match for document {match.get('document_id', 'unknown')}: {str(e)}")
         
+        bump_table_versions(cursor, 'matched_documents')
         conn.commit()
-        conn.close()
+        release_db_connection(conn)
+        response_cache.invalidate([f"matched:{persona_id}"])
         
         result = {
             'success': True,
@@ -1158,105 +2150,113 @@ class APIHandler(BaseHTTPRequestHandler):
             'timestamp': datetime.now().isoformat()
         }
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self._send_json_response(200, result)
     
     def get_matched_documents(self, query_params):
         """Get matched documents for a persona"""
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
         persona_id = query_params.get('persona_id', [None])[0]
+        limit = int(query_params.get('limit', [-1])[0])
+        cursor_token = query_params.get('cursor', [None])[0]
         
         if not persona_id:
-            conn.close()
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "persona_id is required"}).encode())
+            self._send_json_response(400, {"error": "persona_id is required"})
             return
         
+        try:
+            position = decode_cursor(cursor_token, 3) if cursor_token else None
+        except ValueError as e:
+            self._send_json_response(400, {"error": str(e)})
+            return
+        
+        generation = response_cache.generation()
+        stream = self._wants_ndjson(query_params)
+        # Matches embed document details, so a document write changes this payload too
+        etag = table_versions_etag('matched_documents', 'documents', variant='-ndjson' if stream else '')
+        if self._not_modified(etag):
+            return
+        
+        cache_key = self._response_cache_key()
+        if not stream and self._send_cached_response(cache_key, etag):
+            return
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
         # Get matched documents with full document details
-        cursor.execute("""
-            SELECT 
-                md.id,
-                md.persona_id,
-                md.document_id,
-                md.similarity_score,
-                md.gpt_relevance_score,
-                md.relevance_reason,
-                md.gpt_reasoning,
-                md.gpt_thought_process,
-                md.created_at,
-                d.title,
-                d.text,
-                d.agency_id,
-                d.document_type,
-                d.web_comment_link,
-                d.web_document_link,
-                d.web_docket_link,
-                d.docket_id,
-                d.posted_date,
-                d.comment_end_date
-            FROM matched_documents md
-            JOIN documents d ON md.document_id = d.document_id
-            WHERE md.persona_id = ?
-            ORDER BY md.gpt_relevance_score DESC, md.similarity_score DESC
-        """, (persona_id,))
+        cursor.execute(matched_documents_page_sql(keyset=bool(position)), (persona_id, *(position or ()), limit))
         
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'id': row[0],
-                'persona_id': row[1],
-                'document_id': row[2],
-                'similarity_score': row[3],
-                'gpt_relevance_score': row[4],
-                'relevance_reason': row[5],
-                'gpt_reasoning': row[6],
-                'gpt_thought_process': row[7],
-                'created_at': row[8],
-                'document': {
-                    'id': row[2],  # document_id
-                    'document_id': row[2],
-                    'title': row[9],
-                    'text': row[10],
-                    'agency_id': row[11],
-                    'document_type': row[12],
-                    'web_comment_link': row[13],
-                    'web_document_link': row[14],
-                    'web_docket_link': row[15],
-                    'docket_id': row[16],
-                    'posted_date': row[17],
-                    'comment_end_date': row[18]
-                }
-            })
+        if stream:
+            try:
+                self._send_ndjson_stream(cursor, matched_document_row_to_dict, {'ETag': etag})
+            finally:
+                release_db_connection(conn)
+            return
         
-        conn.close()
+        rows = cursor.fetchall()
+        results = [matched_document_row_to_dict(row) for row in rows]
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(results).encode())
+        release_db_connection(conn)
+        
+        headers = {'ETag': etag}
+        if rows and len(rows) == limit:
+            headers['X-Next-Cursor'] = encode_cursor((rows[-1][4], rows[-1][3], rows[-1][0]))
+        
+        # Any document write can change which matches join (a match may name a document inserted later)
+        tags = [f"matched:{persona_id}", 'documents']
+        self._send_json_response(200, results, headers, cache=(cache_key, generation, tags))
 
-def run_server(port=8001):
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that hands each accepted connection to a bounded worker pool"""
+    request_queue_size = 128
+    
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='navi-api')
+    
+    def process_request(self, request, client_address):
+        """Queue the connection instead of serving it on the accept thread"""
+        self.executor.submit(self._process_request_worker, request, client_address)
+    
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+    
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def run_server(port=8001, workers=DEFAULT_WORKERS):
     """Run the HTTP server"""
     init_db()
-    server = HTTPServer(('localhost', port), APIHandler)
-    print(f"🚀 Simple Navi API server running on http://localhost:{port}")
+    threading.Thread(target=migrate_embeddings_to_blob, name='navi-embedding-migration', daemon=True).start()
+    if ann_index is not None:
+        ann_index.open()
+    ingest_jobs.start()
+    server = ThreadPoolHTTPServer(('localhost', port), APIHandler, workers=workers)
+    print(f"🚀 Simple Navi API server running on http://localhost:{port} ({workers} workers)")
     print(f"📚 API docs: http://localhost:{port}/health")
     print("Press Ctrl+C to stop")
     
+    # SIGTERM takes the same path as Ctrl+C, so the ANN index and ingest jobs are flushed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n👋 Server stopped")
-        server.shutdown()
+    finally:
+        server.server_close()
+        # Close the connections only once no ingest worker is partway through a batch on them
+        jobs_stopped = ingest_jobs.shutdown()
+        if ann_index is not None:
+            ann_index.save()
+        if jobs_stopped:
+            close_db_connections()
 
 if __name__ == "__main__":
     run_server()
@@ -0,0 +1,131 @@
+"""
+Slow Query Log
+Records SQLite statements slower than a threshold with their normalized SQL, parameter shape,
+row count and EXPLAIN QUERY PLAN, and keeps the slowest ones for the debug endpoint
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Distinct normalized statements remembered; the fastest is dropped when full
+MAX_TRACKED_STATEMENTS = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and replace literals and (?, ?, ...) placeholder lists so variants group together"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?, ...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"bytes[{len(value)}]"
+    if isinstance(value, str):
+        return f"str[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shape(parameters) -> str:
+    """Types (and sizes for text/blobs) of the bound parameters, never their values"""
+    if parameters is None:
+        return 'executemany'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{name}: {_value_shape(value)}" for name, value in parameters.items()) + '}'
+    return '(' + ', '.join(_value_shape(value) for value in parameters) + ')'
+
+
+def explain_query_plan(connection, sql: str, parameters) -> Optional[List[str]]:
+    """EXPLAIN QUERY PLAN rows as indented text, or None when the statement cannot be explained"""
+    if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        # A plain cursor, so explaining is not itself timed and reported
+        rows = sqlite3.Cursor(connection).execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error:
+        return None
+    depth = {0: -1}
+    plan = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        plan.append('  ' * depth[node_id] + detail)
+    return plan
+
+
+class SlowQueryLog:
+    """
+    Statement observer for sqlite_timing: logs every statement at or over threshold_ms and
+    aggregates them by normalized SQL. The query plan is captured when a statement first shows up
+    and again whenever it sets a new maximum.
+    """
+
+    def __init__(self, threshold_ms: float, top_n: int = 20):
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self._statements: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, connection, sql: str, parameters, seconds: float, rows: int):
+        elapsed_ms = seconds * 1000
+        if self.threshold_ms < 0 or elapsed_ms < self.threshold_ms:
+            return
+        normalized = normalize_sql(sql)
+        shape = parameter_shape(parameters)
+
+        with self._lock:
+            entry = self._statements.get(normalized)
+            needs_plan = entry is None or elapsed_ms > entry['max_ms']
+        plan = explain_query_plan(connection, sql, parameters) if needs_plan else None
+
+        logger.warning(f"Slow query {elapsed_ms:.1f}ms rows={rows} params={shape}: {normalized}"
+                       + ''.join(f"\n    {line}" for line in plan or ()))
+
+        with self._lock:
+            entry = self._statements.get(normalized)
+            if entry is None:
+                if len(self._statements) >= MAX_TRACKED_STATEMENTS:
+                    fastest = min(self._statements, key=lambda key: self._statements[key]['max_ms'])
+                    del self._statements[fastest]
+                entry = self._statements[normalized] = {
+                    'sql': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'last_ms': 0.0, 'rows': 0, 'parameters': shape, 'plan': None, 'last_seen': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['last_ms'] = elapsed_ms
+            entry['last_seen'] = time.time()
+            if elapsed_ms > entry['max_ms']:
+                entry['max_ms'] = elapsed_ms
+                entry['rows'] = rows
+                entry['parameters'] = shape
+                if plan is not None:
+                    entry['plan'] = plan
+
+    def top(self, limit: Optional[int] = None) -> List[Dict]:
+        """The slowest statements by maximum duration"""
+        with self._lock:
+            entries = sorted(self._statements.values(), key=lambda entry: entry['max_ms'], reverse=True)
+            entries = [dict(entry) for entry in entries[:limit or self.top_n]]
+        for entry in entries:
+            entry['avg_ms'] = round(entry['total_ms'] / entry['count'], 3)
+            entry['total_ms'] = round(entry['total_ms'], 3)
+            entry['max_ms'] = round(entry['max_ms'], 3)
+            entry['last_ms'] = round(entry['last_ms'], 3)
+        return entries
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
@@ -0,0 +1,146 @@
+"""
+SQLite Timing
+Connection and cursor subclasses that time every statement and fetch, and report them to observers
+"""
+
+import sqlite3
+import time
+from typing import Callable, List
+
+# Each observer is called as observer(sql, seconds) after a statement or fetch completes
+observers: List[Callable[[str, float], None]] = []
+
+# Each statement observer is called as observer(connection, sql, parameters, seconds, rows) once a
+# statement is finished: its rows are exhausted, the cursor runs another statement, or it is closed.
+# seconds covers the execute call and every fetch. parameters is None for executemany.
+statement_observers: List[Callable] = []
+
+
+def _report(sql: str, started: float) -> float:
+    elapsed = time.perf_counter() - started
+    for observer in observers:
+        observer(sql, elapsed)
+    return elapsed
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor whose execute/fetch time is reported to the registered observers"""
+
+    _sql = ''
+    _parameters = None
+    _elapsed = 0.0
+    _rows = 0
+    _open = False
+
+    def _begin(self, sql, parameters):
+        self._finish()
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+        self._rows = 0
+        self._open = True
+
+    def _finish(self):
+        if not self._open:
+            return
+        self._open = False
+        for observer in statement_observers:
+            observer(self.connection, self._sql, self._parameters, self._elapsed, self._rows)
+
+    def _executed(self, started):
+        self._elapsed += _report(self._sql, started)
+        if self.description is None:
+            # Not a query, so there is nothing to fetch and the statement is complete
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+
+    def _fetched(self, started, rows, exhausted):
+        self._elapsed += _report(self._sql, started)
+        self._rows += rows
+        if exhausted:
+            self._finish()
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._executed(started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._executed(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = None
+        try:
+            row = super().fetchone()
+            return row
+        finally:
+            self._fetched(started, int(row is not None), row is None)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchmany(size)
+            return rows
+        finally:
+            self._fetched(started, len(rows), len(rows) < size)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchall()
+            return rows
+        finally:
+            self._fetched(started, len(rows), True)
+
+    def __next__(self):
+        started = time.perf_counter()
+        exhausted = True
+        try:
+            row = super().__next__()
+            exhausted = False
+            return row
+        finally:
+            self._fetched(started, int(not exhausted), exhausted)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Single-row lookups usually stop after one fetchone(); report them when the cursor is dropped
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including those behind conn.execute) are TimedCursors"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _report('COMMIT', started)
@@ -0,0 +1,61 @@
+"""
+Query plan checks for keyset pagination of /documents and /matched-documents.
+Run with: python -m unittest test_keyset_pagination
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import simple_main
+
+
+class KeysetPaginationPlanTest(unittest.TestCase):
+    """The cursor queries must walk their composite indexes, never scan or sort"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.previous_db_file = simple_main.DB_FILE
+        simple_main.DB_FILE = os.path.join(cls.tmpdir.name, 'navi-test.db')
+        simple_main.init_db()
+        cls.conn = sqlite3.connect(simple_main.DB_FILE)
+        # Give the planner statistics for a realistically sized table
+        cls.conn.executemany(
+            "INSERT INTO documents (document_id, title, text, posted_date) VALUES (?, ?, ?, ?)",
+            [(f"PLAN-{i:05d}", f"Document {i}", "text", f"2025-01-{i % 28 + 1:02d}") for i in range(2000)])
+        cls.conn.executemany(
+            "INSERT INTO matched_documents (persona_id, document_id, similarity_score, gpt_relevance_score) "
+            "VALUES (?, ?, ?, ?)",
+            [(i % 20 + 1, f"PLAN-{i:05d}", (i % 100) / 100, i % 10) for i in range(2000)])
+        cls.conn.commit()
+        cls.conn.execute("ANALYZE")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        simple_main.DB_FILE = cls.previous_db_file
+        cls.tmpdir.cleanup()
+
+    def query_plan(self, sql, parameters):
+        rows = self.conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+        return [row[3] for row in rows]
+
+    def assertUsesIndex(self, plan, index):
+        self.assertTrue(any(line.startswith('SEARCH') and f'USING INDEX {index}' in line for line in plan), plan)
+        self.assertFalse(any(line.startswith('SCAN') or 'USE TEMP B-TREE' in line for line in plan), plan)
+
+    def test_documents_cursor_query(self):
+        sql = simple_main.documents_page_sql(simple_main.DOCUMENT_FIELDS, keyset=True)
+        plan = self.query_plan(sql, ('2025-01-15', 1000, 50))
+        self.assertUsesIndex(plan, 'idx_documents_posted_date')
+
+    def test_matched_documents_cursor_query(self):
+        sql = simple_main.matched_documents_page_sql(keyset=True)
+        plan = self.query_plan(sql, (3, 5, 0.5, 1000, 50))
+        self.assertUsesIndex(plan, 'idx_matched_documents_persona_rank')
+
+
+if __name__ == '__main__':
+    unittest.main()
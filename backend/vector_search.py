@@ -0,0 +1,591 @@
+"""
+Vector Search
+In-memory embedding matrix and on-disk IVF index used for server-side similarity search
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from embedding_codec import is_packed, read_header
+
+try:
+    import numpy as np
+except ImportError:  # similarity search is unavailable without numpy, the rest of the API still works
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def embedding_to_array(value) -> Optional["np.ndarray"]:
+    """Decode a stored embedding (packed BLOB or legacy JSON) straight into a float32 vector"""
+    if value is None or value == '' or value == b'':
+        return None
+    try:
+        if is_packed(value):
+            header = read_header(value)
+            return np.frombuffer(value, dtype='<f4', count=header.rows * header.dim,
+                                 offset=header.data_offset).reshape(header.rows, header.dim)[0]
+        return np.asarray(json.loads(value), dtype=np.float32)
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def embedding_to_matrix(value) -> Optional["np.ndarray"]:
+    """Decode a stored embedding into a 2-D float32 array (one row per vector or chunk)"""
+    if value is None or value == '' or value == b'':
+        return None
+    try:
+        if is_packed(value):
+            header = read_header(value)
+            return np.frombuffer(value, dtype='<f4', count=header.rows * header.dim,
+                                 offset=header.data_offset).reshape(header.rows, header.dim)
+        return np.atleast_2d(np.asarray(json.loads(value), dtype=np.float32))
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def normalize_rows(matrix: "np.ndarray") -> "np.ndarray":
+    """L2-normalise each row so a dot product is a cosine similarity (zero rows stay zero)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """Indices of the k highest scores, best first"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class DocumentEmbeddingMatrix:
+    """
+    Holds every document embedding as one L2-normalised float32 matrix per dimension,
+    so a persona can be scored against the whole corpus with a single matrix-vector product.
+    The matrix is rebuilt lazily after invalidate() is called by a write handler.
+    """
+
+    def __init__(self, connection_factory: Callable):
+        self._connection_factory = connection_factory
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._loaded_generation = -1
+        # dimension -> (document ids, normalised matrix)
+        self._matrices: Dict[int, Tuple[List[str], "np.ndarray"]] = {}
+
+    def invalidate(self):
+        """Mark the matrix stale; the next search reloads it from SQLite"""
+        with self._lock:
+            self._generation += 1
+
+    def _load(self) -> Dict[int, Tuple[List[str], "np.ndarray"]]:
+        conn = self._connection_factory()
+        cursor = conn.cursor()
+        cursor.execute("SELECT document_id, embedding FROM documents WHERE embedding IS NOT NULL")
+
+        grouped: Dict[int, Tuple[List[str], List["np.ndarray"]]] = {}
+        for document_id, value in cursor:
+            vector = embedding_to_array(value)
+            if vector is None or vector.size == 0:
+                continue
+            ids, vectors = grouped.setdefault(vector.shape[0], ([], []))
+            ids.append(document_id)
+            vectors.append(vector)
+
+        matrices = {
+            dim: (ids, normalize_rows(np.vstack(vectors).astype(np.float32, copy=False)))
+            for dim, (ids, vectors) in grouped.items()
+        }
+        logger.info(f"Loaded embedding matrix: {sum(len(ids) for ids, _ in matrices.values())} documents")
+        return matrices
+
+    def snapshot(self, dim: int) -> Optional[tuple]:
+        """Return the loaded arrays for one embedding dimension, reloading if stale"""
+        with self._lock:
+            if self._loaded_generation != self._generation:
+                generation = self._generation
+                self._matrices = self._load()
+                self._loaded_generation = generation
+            return self._matrices.get(dim)
+
+    def search(self, query: Sequence[float], k: int = 10,
+               allowed: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Exact cosine top-k over every document with a same-dimension embedding, optionally restricted to allowed ids"""
+        query_vector = np.asarray(query, dtype=np.float32)
+        loaded = self.snapshot(query_vector.shape[0])
+        if loaded is None:
+            return []
+        ids, matrix = loaded
+
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return []
+        if allowed is not None:
+            rows = np.fromiter((i for i, document_id in enumerate(ids) if document_id in allowed), dtype=np.int64)
+            scores = matrix[rows] @ (query_vector / norm)
+            return [(ids[rows[i]], float(scores[i])) for i in top_k(scores, k)]
+        scores = matrix @ (query_vector / norm)
+        return [(ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+
+class ChunkEmbeddingMatrix(DocumentEmbeddingMatrix):
+    """
+    Stacks every document's chunk embeddings into one contiguous L2-normalised matrix
+    per dimension, with an offset table mapping chunk rows back to documents.
+    Documents without chunk embeddings contribute their single embedding as one chunk.
+    """
+
+    SCORING_MODES = ('maxsim', 'topn_mean')
+
+    def _load(self) -> Dict[int, tuple]:
+        conn = self._connection_factory()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT document_id, embedding, chunk_embeddings FROM documents
+            WHERE embedding IS NOT NULL OR chunk_embeddings IS NOT NULL
+        """)
+
+        grouped: Dict[int, Tuple[List[str], List["np.ndarray"]]] = {}
+        for document_id, embedding, chunk_embeddings in cursor:
+            chunks = embedding_to_matrix(chunk_embeddings)
+            if chunks is None or chunks.size == 0:
+                chunks = embedding_to_matrix(embedding)
+            if chunks is None or chunks.size == 0:
+                continue
+            ids, blocks = grouped.setdefault(chunks.shape[1], ([], []))
+            ids.append(document_id)
+            blocks.append(chunks)
+
+        matrices = {}
+        for dim, (ids, blocks) in grouped.items():
+            counts = np.array([block.shape[0] for block in blocks], dtype=np.int64)
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            chunk_documents = np.repeat(np.arange(len(ids)), counts)
+            matrix = normalize_rows(np.vstack(blocks).astype(np.float32, copy=False))
+            matrices[dim] = (ids, matrix, offsets, counts, chunk_documents)
+        logger.info(f"Loaded chunk matrix: {sum(m[1].shape[0] for m in matrices.values())} chunks "
+                    f"across {sum(len(m[0]) for m in matrices.values())} documents")
+        return matrices
+
+    def search(self, query: Sequence[float], k: int = 10, scoring: str = 'maxsim',
+               top_n: int = 3) -> List[Tuple[str, float]]:
+        """
+        Score the query against every chunk in one pass, then reduce per document:
+        'maxsim' keeps the best chunk, 'topn_mean' averages the best top_n chunks.
+        """
+        query_vector = np.asarray(query, dtype=np.float32)
+        loaded = self.snapshot(query_vector.shape[0])
+        if loaded is None:
+            return []
+        ids, matrix, offsets, counts, chunk_documents = loaded
+
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return []
+        chunk_scores = matrix @ (query_vector / norm)
+
+        if scoring == 'topn_mean':
+            top_n = max(1, top_n)
+            # Order chunks by (document, score desc); a chunk's rank is its distance from the document's offset
+            order = np.lexsort((-chunk_scores, chunk_documents))
+            ranks = np.arange(order.shape[0]) - offsets[chunk_documents[order]]
+            keep = order[ranks < top_n]
+            totals = np.bincount(chunk_documents[keep], weights=chunk_scores[keep], minlength=len(ids))
+            scores = totals / np.minimum(counts, top_n)
+        else:
+            scores = np.maximum.reduceat(chunk_scores, offsets)
+
+        return [(ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF-Flat) index over L2-normalised vectors of one dimension.
+    Vectors are bucketed by their nearest k-means centroid; a query only scores the
+    vectors in its nprobe closest buckets, trading recall for latency.
+    Until enough vectors exist to train the centroids, searches are exact.
+    """
+
+    MIN_TRAIN_SIZE = 256
+    # Retrain the coarse quantizer once the index has grown this much since the last training
+    RETRAIN_GROWTH = 4.0
+    KMEANS_ITERATIONS = 10
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+        self._assignments = np.empty(0, dtype=np.int32)
+        self.centroids: Optional["np.ndarray"] = None
+        self.trained_size = 0
+        # Inverted lists, rebuilt lazily after mutations
+        self._order: Optional["np.ndarray"] = None
+        self._offsets: Optional["np.ndarray"] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> "np.ndarray":
+        return self._vectors[:self._size]
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else self.centroids.shape[0]
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed <= self._vectors.shape[0]:
+            return
+        capacity = max(needed, 2 * self._vectors.shape[0], 1024)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        assignments = np.zeros(capacity, dtype=np.int32)
+        assignments[:self._size] = self._assignments[:self._size]
+        self._vectors, self._assignments = vectors, assignments
+
+    def _assign(self, vectors: "np.ndarray") -> "np.ndarray":
+        if self.centroids is None:
+            return np.zeros(vectors.shape[0], dtype=np.int32)
+        assignments = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], 8192):
+            block = vectors[start:start + 8192]
+            assignments[start:start + block.shape[0]] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def upsert(self, document_ids: Sequence[str], vectors: "np.ndarray"):
+        """Insert or replace vectors (rows are normalised here)"""
+        if len(document_ids) == 0:
+            return
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(document_ids), self.dim))
+        assignments = self._assign(vectors)
+        self._reserve(len(document_ids))
+        for document_id, vector, assignment in zip(document_ids, vectors, assignments):
+            position = self._positions.get(document_id)
+            if position is None:
+                position = self._size
+                self._positions[document_id] = position
+                self.ids.append(document_id)
+                self._size += 1
+            self._vectors[position] = vector
+            self._assignments[position] = assignment
+        self._order = None
+        self._maybe_train()
+
+    def remove(self, document_ids: Sequence[str]):
+        """Drop vectors by swapping the last row into their slot"""
+        for document_id in document_ids:
+            position = self._positions.pop(document_id, None)
+            if position is None:
+                continue
+            last = self._size - 1
+            if position != last:
+                moved_id = self.ids[last]
+                self.ids[position] = moved_id
+                self._positions[moved_id] = position
+                self._vectors[position] = self._vectors[last]
+                self._assignments[position] = self._assignments[last]
+            self.ids.pop()
+            self._size -= 1
+        self._order = None
+
+    def _maybe_train(self):
+        if self._size < self.MIN_TRAIN_SIZE:
+            return
+        if self.centroids is not None and self._size < self.trained_size * self.RETRAIN_GROWTH:
+            return
+        self.train()
+
+    def train(self, seed: int = 0):
+        """Fit spherical k-means centroids (nlist ~ sqrt(n)) and reassign every vector"""
+        vectors = self.vectors
+        nlist = int(max(1, min(4096, round(np.sqrt(self._size)))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(self._size, nlist * 64)
+        sample = vectors[rng.choice(self._size, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids.astype(np.float32)
+        self._assignments[:self._size] = self._assign(vectors)
+        self.trained_size = self._size
+        self._order = None
+        logger.info(f"Trained IVF index: {self._size} vectors, {nlist} lists, dim {self.dim}")
+
+    def _inverted_lists(self) -> Tuple["np.ndarray", "np.ndarray"]:
+        if self._order is None:
+            assignments = self._assignments[:self._size]
+            self._order = np.argsort(assignments, kind='stable')
+            self._offsets = np.searchsorted(assignments[self._order], np.arange(self.nlist + 1))
+        return self._order, self._offsets
+
+    def search(self, query: "np.ndarray", k: int, nprobe: int) -> List[Tuple[str, float]]:
+        """Approximate cosine top-k; exact when untrained or nprobe covers every list"""
+        if self._size == 0:
+            return []
+        query = query / (np.linalg.norm(query) or 1.0)
+        nprobe = max(1, nprobe)
+
+        if self.centroids is None or nprobe >= self.nlist:
+            scores = self.vectors @ query
+            return [(self.ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+        order, offsets = self._inverted_lists()
+        probes = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+        scores = self._vectors[candidates] @ query
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top_k(scores, k)]
+
+    def state(self) -> Dict[str, "np.ndarray"]:
+        """Copy of the arrays save() writes, so the file can be written without holding a lock"""
+        return {
+            'ids': np.array(self.ids, dtype=str),
+            'vectors': self.vectors.copy(),
+            'assignments': self._assignments[:self._size].copy(),
+            'centroids': self.centroids.copy() if self.centroids is not None else np.empty((0, self.dim), np.float32),
+            'trained_size': np.array(self.trained_size),
+        }
+
+    @staticmethod
+    def write(path: str, state: Dict[str, "np.ndarray"]):
+        """Atomically write a state() snapshot to an .npz file"""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **state)
+        os.replace(tmp_path, path)
+
+    def vector(self, document_id: str) -> Optional["np.ndarray"]:
+        """The stored (normalised) vector for a document, or None"""
+        position = self._positions.get(document_id)
+        return None if position is None else self._vectors[position]
+
+    def save(self, path: str):
+        """Atomically write the index to an .npz file"""
+        self.write(path, self.state())
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            vectors = data['vectors']
+            index = cls(vectors.shape[1])
+            index.ids = [str(document_id) for document_id in data['ids']]
+            index._positions = {document_id: i for i, document_id in enumerate(index.ids)}
+            index._vectors = vectors.astype(np.float32)
+            index._assignments = data['assignments'].astype(np.int32)
+            index._size = len(index.ids)
+            index.centroids = data['centroids'] if data['centroids'].shape[0] else None
+            index.trained_size = int(data['trained_size'])
+        return index
+
+
+class PersistentANNIndex:
+    """
+    On-disk approximate-nearest-neighbour index over documents.embedding,
+    one IVFIndex per embedding dimension stored as ivf_<dim>.npz under index_dir.
+    Write handlers keep it current through upsert()/remove(); changed partitions are written
+    by a background saver thread. On startup the files are checked vector by vector against
+    SQLite and rebuilt if they differ (e.g. after a crash before the last save).
+    """
+
+    SAVE_INTERVAL = 30.0
+    # Vector comparison tolerance when checking the files against the table
+    VERIFY_TOLERANCE = 1e-6
+
+    def __init__(self, index_dir: str, connection_factory: Callable, nprobe: int = 8):
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self._connection_factory = connection_factory
+        self._lock = threading.RLock()
+        self._indexes: Dict[int, IVFIndex] = {}
+        # Partitions changed since their last save, and whether a removed partition's file must go
+        self._dirty_dims: Set[int] = set()
+        self._dirty = False
+        self._last_save = 0.0
+        # Serialises file writes (background saver, shutdown flush, rebuild)
+        self._save_lock = threading.Lock()
+        self._save_requested = threading.Event()
+        self._saver: Optional[threading.Thread] = None
+
+    def _path(self, dim: int) -> str:
+        return os.path.join(self.index_dir, f"ivf_{dim}.npz")
+
+    def open(self):
+        """Load the on-disk index, rebuilding it from SQLite if it does not match the table"""
+        with self._lock:
+            self._indexes = {}
+            if os.path.isdir(self.index_dir):
+                for name in os.listdir(self.index_dir):
+                    if name.startswith('ivf_') and name.endswith('.npz') and '.tmp' not in name:
+                        try:
+                            index = IVFIndex.load(os.path.join(self.index_dir, name))
+                            self._indexes[index.dim] = index
+                        except (OSError, ValueError, KeyError) as e:
+                            logger.warning(f"Ignoring unreadable ANN index {name}: {e}")
+
+            if not self._matches_table():
+                self.rebuild()
+
+    def _matches_table(self) -> bool:
+        """
+        True if the loaded partitions hold exactly the table's embeddings. Compares content,
+        not just counts, so an embedding changed in place after the last save is caught.
+        """
+        conn = self._connection_factory()
+        cursor = conn.cursor()
+        cursor.execute("SELECT document_id, embedding FROM documents WHERE embedding IS NOT NULL")
+        grouped: Dict[int, Tuple[List["np.ndarray"], List["np.ndarray"]]] = {}
+        seen = 0
+        for document_id, value in cursor:
+            vector = embedding_to_array(value)
+            if vector is None or vector.size == 0:
+                continue
+            index = self._indexes.get(vector.shape[0])
+            stored = index.vector(document_id) if index is not None else None
+            if stored is None:
+                return False
+            expected, actual = grouped.setdefault(vector.shape[0], ([], []))
+            expected.append(vector)
+            actual.append(stored)
+            seen += 1
+        if seen != sum(len(index) for index in self._indexes.values()):
+            return False
+        return all(np.allclose(normalize_rows(np.vstack(expected)), np.vstack(actual), atol=self.VERIFY_TOLERANCE)
+                   for expected, actual in grouped.values())
+
+    def rebuild(self):
+        """Rebuild every partition from the documents table"""
+        with self._lock:
+            conn = self._connection_factory()
+            cursor = conn.cursor()
+            cursor.execute("SELECT document_id, embedding FROM documents WHERE embedding IS NOT NULL")
+            grouped: Dict[int, Tuple[List[str], List["np.ndarray"]]] = {}
+            for document_id, value in cursor:
+                vector = embedding_to_array(value)
+                if vector is None or vector.size == 0:
+                    continue
+                ids, vectors = grouped.setdefault(vector.shape[0], ([], []))
+                ids.append(document_id)
+                vectors.append(vector)
+
+            self._indexes = {}
+            for dim, (ids, vectors) in grouped.items():
+                index = IVFIndex(dim)
+                index.upsert(ids, np.vstack(vectors))
+                self._indexes[dim] = index
+            self._dirty_dims = set(self._indexes)
+            self._dirty = True
+            self.save()
+            logger.info(f"Rebuilt ANN index: {sum(len(ids) for ids, _ in grouped.values())} documents")
+
+    def upsert(self, items: Sequence[Tuple[str, Optional[Sequence[float]]]]):
+        """Apply (document_id, embedding) writes; a missing embedding removes the document"""
+        with self._lock:
+            additions: Dict[int, Tuple[List[str], List["np.ndarray"]]] = {}
+            removals = []
+            for document_id, embedding in items:
+                if embedding:
+                    vector = np.asarray(embedding, dtype=np.float32)
+                    ids, vectors = additions.setdefault(vector.shape[0], ([], []))
+                    ids.append(document_id)
+                    vectors.append(vector)
+                else:
+                    removals.append(document_id)
+
+            for dim, (ids, vectors) in additions.items():
+                # A document's embedding may have changed dimension; drop it from other partitions
+                for other_dim, index in self._indexes.items():
+                    if other_dim != dim:
+                        index.remove(ids)
+                        self._dirty_dims.add(other_dim)
+                self._indexes.setdefault(dim, IVFIndex(dim)).upsert(ids, np.vstack(vectors))
+                self._dirty_dims.add(dim)
+            if removals:
+                for dim, index in self._indexes.items():
+                    index.remove(removals)
+                    self._dirty_dims.add(dim)
+            if additions or removals:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._indexes = {}
+            self._dirty = True
+            self.save()
+
+    def search(self, query: Sequence[float], k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        query_vector = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            index = self._indexes.get(query_vector.shape[0])
+            if index is None:
+                return []
+            return index.search(query_vector, k, nprobe or self.nprobe)
+
+    def save(self):
+        """
+        Write changed partitions to disk and remove files for partitions that no longer exist.
+        Partitions are copied under the lock and written outside it, so searches are not blocked.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshots = {dim: self._indexes[dim].state() for dim in self._dirty_dims if dim in self._indexes}
+                live_dims = set(self._indexes)
+                self._dirty_dims = set()
+                self._dirty = False
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                for dim, state in snapshots.items():
+                    IVFIndex.write(self._path(dim), state)
+                for name in os.listdir(self.index_dir):
+                    if name.startswith('ivf_') and name.endswith('.npz'):
+                        dim = name[len('ivf_'):-len('.npz')]
+                        if not dim.isdigit() or int(dim) not in live_dims:
+                            os.remove(os.path.join(self.index_dir, name))
+            except OSError:
+                with self._lock:
+                    self._dirty_dims.update(snapshots)
+                    self._dirty = True
+                raise
+            self._last_save = time.monotonic()
+
+    def request_save(self):
+        """Save on the background saver thread; requests made while a save runs are coalesced"""
+        with self._lock:
+            if self._saver is None or not self._saver.is_alive():
+                self._saver = threading.Thread(target=self._save_loop, name='ann-index-saver', daemon=True)
+                self._saver.start()
+        self._save_requested.set()
+
+    def _save_loop(self):
+        while True:
+            self._save_requested.wait()
+            self._save_requested.clear()
+            try:
+                self.save()
+            except OSError as e:
+                logger.error(f"Could not save ANN index: {e}")
+
+    def maybe_save(self):
+        """Request a save at most once per SAVE_INTERVAL; used after single-document updates"""
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.request_save()